@@ -14,12 +14,16 @@ Field aliasing enables to virtually:
 * change key names
 * modify the apparent structure of the dict
 """
-from .signals import class_ready
-from .utils import import_module
+from .signals import class_ready, config_changed
+from .utils import import_module, LRUCache, NullCache
 from holon import Reaktor
 from iso8601 import iso8601
+from operator import itemgetter
 # from money import Money
+import copy_reg
 import inspect
+import json
+import weakref
 
 
 __all__ = [
@@ -48,6 +52,20 @@ _default_config = {
     'DEFAULT_CACHE_ENGINE_NAME': 'barrel',
     # this setting should be overridden
     'REAKTOR': Reaktor(**_reaktor_config),
+    # clients kept by `barrel.rpc.ClientPool`, 0 disabling the pool
+    'REAKTOR_POOL_SIZE': 8,
+    # seconds to wait for a free client
+    'REAKTOR_POOL_TIMEOUT': 10,
+    # seconds after which an idle client is dropped, before the server does it
+    'REAKTOR_POOL_MAX_IDLE': 60,
+    # callable telling if an idle client is still usable, e.g. pinging the server
+    'REAKTOR_POOL_CHECK': None,
+    # threads running the concurrent calls of `barrel.rpc.do_rpc_calls`
+    'RPC_WORKERS': 8,
+    # seconds to wait for the concurrent calls of `barrel.rpc.do_rpc_calls`
+    'RPC_TIMEOUT': 60,
+    # share one request between the identical RPC calls in flight
+    'RPC_SINGLE_FLIGHT': False,
 }
 
 
@@ -58,6 +76,7 @@ class Config(object):
 
     def configure(self, **kwargs):
         self.config.update(kwargs)
+        config_changed.send(self, **kwargs)
 
     def __getattribute__(self, name):
         get_attr = super(Config, self).__getattribute__
@@ -91,23 +110,57 @@ def resolve_pending_fields(sender):
 class_ready.connect(resolve_pending_fields)
 
 
+# attributes of compact stores, see `Store`
+COMPACT_SLOTS = ('data', '_embedded_stores_cache', '_values_cache')
+
+
+def compact_getstate(store):
+    """Pickles the data and the other attributes of a compact store,
+    leaving the caches out.
+    """
+    state = {'data': store.data}
+    state.update(store.__dict__)
+    return state
+
+
+def compact_setstate(store, state):
+    store.data = state.pop('data')
+    store._embedded_stores_cache = None
+    store._values_cache = None
+    if state:
+        store.__dict__.update(state)
+
+
 class StoreMeta(type):
     """Metaclass that farms and gather `Field`-type attributes in a new
     `fields` attributes. This `fields` attribute later helps to easily
     identify if an attribute is `Field` typed without iterating through all
     attributes.
+    Fields are data descriptors, so the metaclass also tells each field
+    the attribute name it is bound to.
     """
     def __new__(cls, name, bases, attrs):
-        fields = {}
-        for k, f in attrs.iteritems():
-            if isinstance(f, (Field,)):
-                fields[k] = f
-        # adding parents' fields
-        for parent in bases:
-            if hasattr(parent, 'fields'):
-                fields.update(parent.fields)
-        attrs['fields'] = fields
+        # compiled projections and key tree, see `Store.projection` and `Store.key_tree`
+        attrs['_projections'] = {}
+        attrs['_key_tree'] = _skip
+        if attrs.get('compact') and '__slots__' not in attrs:
+            if any(issubclass(parent, list) for parent in bases):
+                raise TypeError("'%s' collection store cannot be compact" % name)
+            if not any(getattr(parent, 'compact', False) for parent in bases):
+                attrs['__slots__'] = COMPACT_SLOTS
+                attrs['__getstate__'] = compact_getstate
+                attrs['__setstate__'] = compact_setstate
         cls = super(StoreMeta, cls).__new__(cls, name, bases, attrs)
+        # walking the whole MRO, so that the fields of plain mixins get named too,
+        # and parents' fields first, so that overridden fields win
+        fields = {}
+        for klass in reversed(cls.__mro__):
+            for k, f in vars(klass).iteritems():
+                if isinstance(f, (Field,)):
+                    if f.name is None:
+                        f.name = k
+                    fields[k] = f
+        cls.fields = fields
         # send `class_ready` signal
         class_ready.send(cls)
         return cls
@@ -125,9 +178,8 @@ def deep_get(deep_key, dictionary, sep=':'):
     """Fetches through multiple dictionary levels, splitting
     the compound key using the specified separator.
     """
-    keys = deep_key.split(sep)
-    while keys:
-        dictionary = dictionary[keys.pop(0)]
+    for key in deep_key.split(sep):
+        dictionary = dictionary[key]
     return dictionary
 
 
@@ -137,39 +189,288 @@ def deep_set(deep_key, dictionary, value, sep=':'):
     """
     keys = deep_key.split(sep)
     last_key = keys.pop()
-    while keys:
-        key = keys.pop(0)
+    for key in keys:
         if key not in dictionary:
             dictionary[key] = {}
         dictionary = dictionary[key]
     dictionary[last_key] = value
 
 
+def target_keys(target, sep=':'):
+    """Splits the target once into the tuple of keys to walk through."""
+    if target and sep in target:
+        return tuple(target.split(sep))
+    return (target,)
+
+
+def compile_getter(keys):
+    """Builds a getter walking the given key path. Single-key paths
+    use the C-level `itemgetter` so the common case costs one call.
+    """
+    if len(keys) == 1:
+        return itemgetter(keys[0])
+
+    def getter(dictionary):
+        for key in keys:
+            dictionary = dictionary[key]
+        return dictionary
+    return getter
+
+
+def compile_setter(keys):
+    """Builds a setter walking the given key path and creating
+    the missing intermediate levels, like `deep_set`.
+    """
+    parent_keys, last_key = keys[:-1], keys[-1]
+    if not parent_keys:
+        def setter(dictionary, value):
+            dictionary[last_key] = value
+        return setter
+
+    def setter(dictionary, value):
+        for key in parent_keys:
+            if key not in dictionary:
+                dictionary[key] = {}
+            dictionary = dictionary[key]
+        dictionary[last_key] = value
+    return setter
+
+
+# marks the fields to leave out of projections when they are missing
+_skip = object()
+
+
+class ItemsKeyTree(dict):
+    """Key tree applying to every item of a collection, i.e. to the items of
+    a list or to the values of a dict.
+    """
+
+
+def merge_key_trees(tree, other):
+    """Merges two key trees. A key tree is a dict mapping keys to the
+    subtree of the keys used below them, `None` meaning that the whole
+    value is used. A value used both as a collection and otherwise is
+    used as a whole.
+    """
+    if tree is None or other is None:
+        return None
+    if isinstance(tree, ItemsKeyTree) != isinstance(other, ItemsKeyTree):
+        return None
+    merged = type(tree)(tree)
+    for key, subtree in other.iteritems():
+        if key in merged:
+            merged[key] = merge_key_trees(merged[key], subtree)
+        else:
+            merged[key] = subtree
+    return merged
+
+
+def prune(tree, data):
+    """Returns a copy of the data keeping only the keys of the key tree.
+    The tree applies to every item of the lists found along the way, and
+    to every value of the dicts found in place of a collection.
+    """
+    if tree is None:
+        return data
+    if isinstance(tree, ItemsKeyTree):
+        if isinstance(data, dict):
+            # dict-shaped collection, see `CollectionStore`
+            return dict((key, prune_item(tree, item)) for key, item in data.iteritems())
+        if isinstance(data, list):
+            return [prune_item(tree, item) for item in data]
+        return data
+    return prune_item(tree, data)
+
+
+def prune_item(tree, data):
+    """Same as `prune`, the tree applying to the data itself."""
+    if isinstance(data, list):
+        return [prune_item(tree, item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    pruned = {}
+    for key, subtree in tree.iteritems():
+        if key in data:
+            pruned[key] = prune(subtree, data[key])
+    return pruned
+
+
+def overrides_get(field):
+    """Tells if the field class overrides `get`, in which case the field
+    has to do the lookup itself instead of only converting the raw value.
+    """
+    return type(field).get.im_func is not Field.get.im_func
+
+
+def lookup_values(field, items):
+    """Returns the raw values at the field target for each of the data dicts,
+    `_skip` marking the missing ones.
+    """
+    if len(field.keys) == 1:
+        key = field.keys[0]
+        return [item.get(key, _skip) for item in items]
+    values = []
+    for item in items:
+        for key in field.keys:
+            if key not in item:
+                item = _skip
+                break
+            item = item[key]
+        values.append(item)
+    return values
+
+
+def raw_values(field, items):
+    """Returns the raw values of the field for each of the data dicts,
+    `_skip` marking the ones missing from the data, whatever the field
+    default. Fields overriding `get` return converted values.
+    """
+    values = lookup_values(field, items)
+    if overrides_get(field):
+        for i, (value, item) in enumerate(zip(values, items)):
+            if value is not _skip:
+                try:
+                    values[i] = field.get(item)
+                except (KeyError,):
+                    values[i] = _skip
+    return values
+
+
+def compile_projection(fields):
+    """Compiles `(name, field)` pairs into a function that extracts all
+    the converted values from a data dict in a single pass. The targets
+    are merged into a tree, so that a prefix shared by several deep targets
+    is only walked once. Missing values are replaced by the field default,
+    or by the given `missing` value unless it is `_skip`.
+    """
+    # a node is a tuple of (leaves, children, fields below the node)
+    root = ([], {}, [])
+    embedded = []
+    custom = []
+    for name, field in fields:
+        if isinstance(field, (EmbeddedStoreField,)):
+            embedded.append((name, field))
+        elif overrides_get(field):
+            custom.append((name, field))
+        else:
+            node = root
+            node[2].append((name, field))
+            for key in field.keys[:-1]:
+                if key not in node[1]:
+                    node[1][key] = ([], {}, [])
+                node = node[1][key]
+                node[2].append((name, field))
+            node[0].append((field.keys[-1], name, field))
+
+    def set_missing(node, values, missing):
+        for name, field in node[2]:
+            if field.default is not None:
+                values[name] = field.convert(field.default)
+            elif missing is not _skip:
+                values[name] = missing
+
+    def walk(node, dct, values, missing):
+        for key, name, field in node[0]:
+            if key in dct:
+                values[name] = field.convert(dct[key])
+            elif field.default is not None:
+                values[name] = field.convert(field.default)
+            elif missing is not _skip:
+                values[name] = missing
+        for key, child in node[1].iteritems():
+            if key in dct:
+                walk(child, dct[key], values, missing)
+            else:
+                set_missing(child, values, missing)
+
+    def project(data, missing=_skip):
+        values = {}
+        walk(root, data, values, missing)
+        for name, field in custom:
+            try:
+                values[name] = field.get(data)
+            except (KeyError,):
+                if missing is not _skip:
+                    values[name] = missing
+        for name, field in embedded:
+            if field.target is False:
+                value = data
+            else:
+                value = data[field.target] if field.target in data else {}
+            if field.is_array:
+                value = CollectionStore(field.store_class, value).to_list(missing=missing)
+            else:
+                value = field.store_class.project(value, missing=missing)
+            values[name] = value
+        return values
+    return project
+
+
 class Field(object):
-    """Base field class for dict datastore handling."""
+    """Base field class for dict datastore handling.
+    The target is compiled once into a getter and a setter, so that
+    accessing the field does not split the compound key every time.
+    Subclasses convert the raw value by overriding `convert`.
+    Fields are data descriptors: reading or writing them on a store
+    instance goes straight to the store data, while plain attributes
+    go through the normal attribute lookup.
+    """
 
     def __init__(self, target, target_sep=':', default=None):
         self.target = target
         self.target_sep = target_sep
         self.default = default
+        # set by `StoreMeta` once the field is bound to a store class
+        self.name = None
+        self.keys = target_keys(target, target_sep)
+        self.getter = compile_getter(self.keys)
+        self.setter = compile_setter(self.keys)
+
+    def __get__(self, store, store_class):
+        if store is None:
+            return self
+        cache = None
+        if store.cache_values:
+            cache = store._values_cache
+            if cache is None:
+                cache = store._values_cache = {}
+            elif self.name in cache:
+                return cache[self.name]
+        try:
+            value = self.get(store.data)
+        except (KeyError,):
+            raise AttributeError("'%s' store lookup failed for '%s'" % (
+                store.__class__.__name__, self.target))
+        if cache is not None:
+            cache[self.name] = value
+        return value
+
+    def __set__(self, store, value):
+        # targets of different fields may overlap, so drop all the cached values
+        if store._values_cache:
+            store._values_cache.clear()
+        try:
+            self.set(store.data, value)
+        except (KeyError,):
+            raise AttributeError("'%s' store lookup failed for '%s'" % (
+                store.__class__.__name__, self.target))
+
+    def convert(self, value):
+        return value
 
     def get(self, dct):
+        # the hottest path of barrel, keep it flat
         try:
-            if self.target and self.target_sep in self.target:
-                return deep_get(self.target, dct, self.target_sep)
-            else:
-                return simple_get(self.target, dct)
+            value = self.getter(dct)
         except KeyError, err:
             if self.default is not None:
-                return self.default
+                value = self.default
             else:
                 raise err
+        return self.convert(value)
 
     def set(self, dct, value):
-        if self.target and self.target_sep in self.target:
-            deep_set(self.target, dct, value, self.target_sep)
-        else:
-            simple_set(self.target, dct, value)
+        self.setter(dct, value)
 
     def __str__(self):
         return "<%s.%s target=%s>" % (self.__module__,
@@ -222,64 +523,68 @@ class EmbeddedStoreField(Field):
             self.store = self.store_class()
         super(EmbeddedStoreField, self).__init__(target)
 
+    def __get__(self, store, store_class):
+        if store is None:
+            return self
+        # making attribute access less costly
+        # no need to create the instance of store on every access
+        cache = store._embedded_stores_cache
+        if cache is None:
+            cache = store._embedded_stores_cache = {}
+        if self.name not in cache:
+            if self.target is False:
+                data = store.data
+            else:
+                data = store.data[self.target] if self.target in store.data else {}
+            if self.is_array:
+                cache[self.name] = CollectionStore(self.store_class, data)
+            else:
+                cache[self.name] = self.store_class(data)
+        return cache[self.name]
+
+    def __set__(self, store, value):
+        # embedded stores are not directly settable
+        raise TypeError("'%s' store does not support %s assignment" % (
+            store.__class__.__name__, EmbeddedStoreField.__name__))
+
 
 class Store(object):
-    """Base model class for dict datastore handling."""
+    """Base model class for dict datastore handling.
+    Setting `cache_values` to `True` memoizes the converted field values
+    per instance. Writing a field drops them; `invalidate` has to be called
+    when the data is modified without going through the fields.
+    Setting `compact` to `True` on a store class stores the data and the
+    caches in slots, the instance `__dict__` only being created if other
+    attributes are set. This is meant for high volume stores.
+    """
     __metaclass__ = StoreMeta
 
+    cache_values = False
+    compact = False
+
     def __init__(self, data=None, **kwargs):
         if data is None:
             data = {}
         self.data = data
-        self._embedded_stores_cache = {}
+        # caches are created on demand
+        self._embedded_stores_cache = None
+        self._values_cache = None
         if kwargs:
             for a, v in kwargs.iteritems():
                 setattr(self, a, v)
 
-    def __getattribute__(self, name):
-        selfattr = super(Store, self).__getattribute__
-        attr = selfattr(name)
-        # in case of embedded store, return the store instead of the field
-        if isinstance(attr, (EmbeddedStoreField,)):
-            # making attribute access less costly
-            # no need to create the instance of store on every access
-            if name not in self._embedded_stores_cache:
-                if attr.target is False:
-                    data = self.data
-                else:
-                    data = self.data[attr.target] if attr.target in self.data else {}
-                if attr.is_array:
-                    store = CollectionStore(attr.store_class, data)
-                else:
-                    store = attr.store_class(data)
-                self._embedded_stores_cache[name] = store
-            return self._embedded_stores_cache[name]
-        # if it's a field, fetch the value in the model data and return it
-        elif isinstance(attr, (Field,)):
-            try:
-                return attr.get(self.data)
-            except (KeyError,):
-                raise AttributeError("'%s' store lookup failed for '%s'" % (
-                    self.__class__.__name__, attr.target))
-        else:
-            return attr
-
-    def __setattr__(self, name, value):
-        if name in self.fields:
-            attr = self.fields[name]
-            # embedded stores are not directly settable
-            if isinstance(attr, (EmbeddedStoreField,)):
-                raise TypeError("'%s' store does not support %s assignment" % (
-                    self.__class__.__name__, EmbeddedStoreField.__name__))
-            # if it's a field, set the value in the model data
-            elif isinstance(attr, (Field,)):
-                try:
-                    attr.set(self.data, value)
-                except (KeyError,):
-                    raise AttributeError("'%s' store lookup failed for '%s'" % (
-                        self.__class__.__name__, attr.target))
-        else:
-            super(Store, self).__setattr__(name, value)
+    def invalidate(self, *names):
+        """Drops the cached values and embedded stores of the given fields,
+        or all of them if no name is given.
+        """
+        for cache in (self._values_cache, self._embedded_stores_cache):
+            if cache is None:
+                continue
+            if names:
+                for name in names:
+                    cache.pop(name, None)
+            else:
+                cache.clear()
 
     def __iter__(self):
         for name in self.fields:
@@ -289,13 +594,142 @@ class Store(object):
     def __nonzero__(self):
         return bool(self.data)
 
+    @classmethod
+    def projection(cls, names=None):
+        """Returns the compiled projection of the given fields,
+        or of all of them if no name is given.
+        """
+        # the names may be an iterator, only to be read once
+        names = tuple(names) if names is not None else None
+        if names not in cls._projections:
+            fields = []
+            for name in (cls.fields if names is None else names):
+                if name not in cls.fields:
+                    raise AttributeError("'%s' store has no field '%s'" % (cls.__name__, name))
+                fields.append((name, cls.fields[name]))
+            cls._projections[names] = compile_projection(fields)
+        return cls._projections[names]
+
+    @classmethod
+    def project(cls, data, names=None, missing=_skip):
+        """Extracts the converted values of the given fields from the raw
+        data in a single pass. Embedded stores are projected as well.
+        Missing fields are left out, unless a `missing` value is given.
+        """
+        return cls.projection(names)(data, missing)
+
+    @classmethod
+    def key_tree(cls, _stack=()):
+        """Compiles the key paths read by the fields of the store, embedded
+        stores included, into a key tree (see `merge_key_trees`). A store
+        without fields is assumed to use all of its data, and so are the
+        stores referencing themselves, directly or not.
+        """
+        if not cls.fields or cls in _stack:
+            return None
+        if not _stack and cls._key_tree is not _skip:
+            return cls._key_tree
+        tree = {}
+        for field in cls.fields.itervalues():
+            if isinstance(field, (EmbeddedStoreField,)):
+                store_class = field.store_class
+                if hasattr(store_class, 'key_tree'):
+                    subtree = store_class.key_tree(_stack + (cls,))
+                else:
+                    subtree = None
+                if field.is_array and subtree is not None:
+                    subtree = ItemsKeyTree(subtree)
+                if field.target is False:
+                    tree = merge_key_trees(tree, subtree)
+                else:
+                    tree = merge_key_trees(tree, {field.target: subtree})
+            else:
+                subtree = None
+                for key in reversed(field.keys):
+                    subtree = {key: subtree}
+                tree = merge_key_trees(tree, subtree)
+        if not _stack:
+            cls._key_tree = tree
+        return tree
+
+    @classmethod
+    def prune(cls, data):
+        """Returns a copy of the data dropping every key no field reads."""
+        return prune(cls.key_tree(), data)
+
+    @classmethod
+    def loads(cls, payload):
+        """Decodes the JSON payload and wraps its pruned data."""
+        return cls(cls.prune(json.loads(payload)))
+
+    def to_dict(self, names=None, missing=_skip):
+        """Returns the field values of the store as a dict, see `project`."""
+        return self.projection(names)(self.data, missing)
+
+
+def item_cache(policy):
+    """Builds the cache of the item stores of a `CollectionStore`:
+
+    * `'strong'` keeps every item store as long as the item is in the collection
+    * `'weak'` keeps the item stores as long as they are referenced elsewhere
+    * `'none'` creates a new item store on every access
+    * an integer keeps at most that many item stores, the least recently used
+      ones being dropped first
+    """
+    if policy == 'strong':
+        return {}
+    elif policy == 'weak':
+        return weakref.WeakValueDictionary()
+    elif policy == 'none':
+        return NullCache()
+    elif isinstance(policy, (int, long)) and policy > 0:
+        return LRUCache(policy)
+    raise ValueError("Invalid cache policy: %r" % (policy,))
+
+
+# views of collections referencing each list of item data, by list identity:
+# different collections may wrap the same list, e.g. the stores of a payload
+collection_views = {}
+
+
+def register_view(items, view):
+    """Tracks a view referencing a list of item data, until it is collected."""
+    key = id(items)
+
+    def forget(ref):
+        views = collection_views.get(key)
+        if views is not None and views.get(id(ref)) is ref:
+            del views[id(ref)]
+            if not views:
+                collection_views.pop(key, None)
+    ref = weakref.ref(view, forget)
+    collection_views.setdefault(key, {})[id(ref)] = ref
+    return ref
+
 
 class CollectionStore(Store, list):
     """Handles collection of stores and provide array-like interface to access
     them. Inherit from list for easy type checking.
+    The item stores are cached by identity of the item data rather than by
+    index, so reordering the collection does not mix them up. See
+    `item_cache` for the available `cache_policy` values.
+
+    Slicing, concatenating and repeating collections return views: their
+    data is a list of `(items, start, stop, owner)` segments referencing the
+    lists of the original collections, whose item store caches are shared.
+    A view copies its data on the first access to `data`, i.e. before it is
+    written to, and a collection copies the data of the views referencing
+    its list before it is written to itself, whichever collection of the
+    list the views were taken from. Changes made to a list without going
+    through a collection are not tracked, though.
     """
+    cache_policy = 'strong'
+    # segments of a view, `None` once the data is copied
+    _segments = None
+    # weak references to the view in `collection_views`
+    _view_refs = None
 
-    def __init__(self, store_class, data=None):
+    def __init__(self, store_class, data=None, cache_policy=None):
         if data is None:
             data = []
         self.store_class = store_class
@@ -304,108 +738,311 @@ class CollectionStore(Store, list):
         # reaktor is fixed (to check in 1.50.16).
         if isinstance(data, dict):
             data = data.values()
-        return super(CollectionStore, self).__init__(data)
+        if cache_policy is not None:
+            self.cache_policy = cache_policy
+        super(CollectionStore, self).__init__(data)
+        self._embedded_stores_cache = item_cache(self.cache_policy)
+
+    def __reduce__(self):
+        # the list items would be the item stores, so only pickle the state
+        return copy_reg.__newobj__, (self.__class__,), self.__getstate__()
+
+    def __getstate__(self):
+        # views are copied and caches dropped, as they cannot all be pickled
+        state = self.__dict__.copy()
+        state['_data'] = self._items()
+        state.pop('_segments', None)
+        state.pop('_view_refs', None)
+        state.pop('_embedded_stores_cache', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._embedded_stores_cache = item_cache(self.cache_policy)
+
+    def _get_data(self):
+        if self._segments is not None:
+            self._materialize()
+        return self._data
+
+    def _set_data(self, data):
+        # the former list is left as is, so are its views
+        if self._segments is not None:
+            self._materialize()
+        self._data = data
+
+    data = property(_get_data, _set_data)
+
+    def _materialize(self):
+        """Copies the data of a view out of its segments."""
+        segments, self._segments = self._segments, None
+        refs, self._view_refs = self._view_refs, None
+        data = []
+        for items, start, stop, owner in segments:
+            data.extend(items[start:stop])
+        for key, ref in refs or ():
+            views = collection_views.get(key)
+            if views is not None:
+                views.pop(id(ref), None)
+                if not views:
+                    collection_views.pop(key, None)
+        self._data = data
+
+    @property
+    def _views(self):
+        """The references to the views of the data, None for a view."""
+        if self._segments is not None:
+            return None
+        return collection_views.get(id(self._data))
+
+    def _detach_views(self):
+        """Makes the views referencing the data copy it, before it changes."""
+        refs = collection_views.pop(id(self._data), {})
+        for ref in refs.values():
+            view = ref()
+            if view is not None and view._segments is not None:
+                view._materialize()
+
+    def _get_segments(self):
+        if self._segments is not None:
+            return self._segments
+        return [(self._data, 0, len(self._data), self)]
+
+    def _view(self, segments):
+        """Returns a collection made of the given segments."""
+        view = self.__class__(self.store_class, None, self.cache_policy)
+        view._segments = segments
+        refs = []
+        for items, start, stop, owner in segments:
+            # the lists of other collections are tracked, not the copies of plain lists
+            if owner is not None:
+                refs.append((id(items), register_view(items, view)))
+        view._view_refs = refs
+        return view
+
+    def _items(self):
+        """Returns the item data for reading only, without copying the data
+        of a collection that is not a view.
+        """
+        if self._segments is None:
+            return self._data
+        data = []
+        for items, start, stop, owner in self._segments:
+            data.extend(items[start:stop])
+        return data
+
+    def _wrap(self, data, owner=None):
+        """Returns the (cached) store of an item, using the cache of the
+        collection owning the item if any.
+        """
+        if owner is not None and owner is not self and owner.store_class is self.store_class:
+            return owner._wrap(data)
+        # the data is referenced by the cached store,
+        # so its identity cannot be reused while the store is cached
+        store = self._embedded_stores_cache.get(id(data))
+        if store is None or store.data is not data:
+            store = self.store_class(data)
+            self._embedded_stores_cache[id(data)] = store
+        return store
+
+    def _forget(self, items):
+        """Drops the cached stores of items removed from the collection."""
+        for data in items:
+            self._embedded_stores_cache.pop(id(data), None)
 
     def __getitem__(self, index):
-        if index not in self._embedded_stores_cache:
-            self._embedded_stores_cache[index] = self.store_class(self.data[index])
-        return self._embedded_stores_cache[index]
+        if isinstance(index, slice):
+            if index.step is None or index.step == 1:
+                start, stop, _ = index.indices(len(self))
+                return self.__getslice__(start, stop)
+            return self.__class__(self.store_class, self._items()[index], self.cache_policy)
+        if self._segments is None:
+            return self._wrap(self._data[index])
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("list index out of range")
+        for items, start, stop, owner in self._segments:
+            if index < stop - start:
+                return self._wrap(items[start + index], owner)
+            index -= stop - start
 
-    # Copied over from the UserList module.
     def __iter__(self):
-        i = 0
-        try:
-            while True:
-                v = self[i]
-                yield v
-                i += 1
-        except IndexError:
-            return
+        if self._segments is None:
+            for data in self._data:
+                yield self._wrap(data)
+        else:
+            for items, start, stop, owner in self._segments:
+                for i in xrange(start, stop):
+                    yield self._wrap(items[i], owner)
+
+    @classmethod
+    def iter_from_stream(cls, store_class, fileobj, path=None, sep=':', prune=False):
+        """Decodes the JSON document read from `fileobj` incrementally and
+        yields a `store_class` instance for each item of the array found at
+        the given key path (the top level array by default). The memory
+        used stays bounded by the size of a single item. With `prune`, the
+        keys the store does not read are dropped. Requires `ijson`.
+        """
+        from .streaming import iter_items
+        for data in iter_items(fileobj, path, sep):
+            if prune:
+                data = store_class.prune(data)
+            yield store_class(data)
+
+    def to_list(self, names=None, missing=_skip):
+        """Returns the field values of every item as a list of dicts,
+        without instantiating the item stores, see `Store.project`.
+        """
+        project = self.store_class.projection(names)
+        return [project(data, missing) for data in self._items()]
+
+    def column(self, name, dtype=None):
+        """Returns the values of a field for every item as a NumPy array,
+        see `columns`.
+        """
+        return self.columns([name], {name: dtype})[name]
+
+    def columns(self, names, dtypes=None):
+        """Extracts the values of the given fields for every item straight
+        from the data, without instantiating the item stores. Returns a dict
+        of NumPy arrays keyed by field name. Items missing a value are masked,
+        in which case the array is a masked array. `dtypes` maps field names
+        to the array data types. Requires NumPy.
+        """
+        import numpy
+        dtypes = dtypes or {}
+        columns = {}
+        for name in names:
+            field = self.store_class.fields.get(name)
+            if field is None:
+                raise AttributeError("'%s' store has no field '%s'" % (
+                    self.store_class.__name__, name))
+            if isinstance(field, (EmbeddedStoreField,)):
+                raise TypeError("'%s' field cannot be extracted as a column" % name)
+            values = raw_values(field, self._items())
+            mask = [value is _skip for value in values]
+            if not (overrides_get(field) or type(field).convert.im_func is Field.convert.im_func):
+                convert = field.convert
+                values = [value if value is _skip else convert(value) for value in values]
+            # masked slots take a present value, keeping the data type of the array
+            fill = next((value for value in values if value is not _skip), 0)
+            values = [fill if value is _skip else value for value in values]
+            if any(mask):
+                columns[name] = numpy.ma.array(values, mask=mask, dtype=dtypes.get(name))
+            else:
+                columns[name] = numpy.array(values, dtype=dtypes.get(name))
+        return columns
 
     def __repr__(self):
-        return repr(self.data)
+        return repr(self._items())
 
     def __lt__(self, other):
-        return self.data < self.__cast(other)
+        return self._items() < self.__cast(other)
 
     def __le__(self, other):
-        return self.data <= self.__cast(other)
+        return self._items() <= self.__cast(other)
 
     def __eq__(self, other):
-        return self.data == self.__cast(other)
+        return self._items() == self.__cast(other)
 
     def __ne__(self, other):
-        return self.data != self.__cast(other)
+        return self._items() != self.__cast(other)
 
     def __gt__(self, other):
-        return self.data > self.__cast(other)
+        return self._items() > self.__cast(other)
 
     def __ge__(self, other):
-        return self.data >= self.__cast(other)
+        return self._items() >= self.__cast(other)
 
     def __cast(self, other):
         if isinstance(other, CollectionStore):
-            return other.data
+            return other._items()
         else:
             return other
 
     def __cmp__(self, other):
-        return cmp(self.data, self.__cast(other))
+        return cmp(self._items(), self.__cast(other))
 
     def __hash__(self):
         raise TypeError("unashable type: '%s'" % self.__class__.__name__)
 
     def __contains__(self, item):
-        return item in self.data
+        return item in self._items()
 
     def __len__(self):
-        return len(self.data)
+        if self._segments is None:
+            return len(self._data)
+        return sum(stop - start for items, start, stop, owner in self._segments)
+
+    def __nonzero__(self):
+        return len(self) > 0
 
     def __setitem__(self, i, item):
+        if self._views:
+            self._detach_views()
+        self._forget(self.data[i] if isinstance(i, slice) else [self.data[i]])
         self.data[i] = item
 
     def __delitem__(self, i):
+        if self._views:
+            self._detach_views()
+        self._forget(self.data[i] if isinstance(i, slice) else [self.data[i]])
         del self.data[i]
 
     def __getslice__(self, i, j):
-        i = max(i, 0)
-        j = max(j, 0)
-        return self.__class__(self.store_class, self.data[i:j])
+        length = len(self)
+        i = min(max(i, 0), length)
+        j = min(max(j, i), length)
+        segments = []
+        for items, start, stop, owner in self._get_segments():
+            size = stop - start
+            if i < size and j > 0:
+                segments.append((items, start + i, start + min(j, size), owner))
+            i = max(i - size, 0)
+            j -= size
+        return self._view(segments)
 
     def __setslice__(self, i, j, other):
+        if self._views:
+            self._detach_views()
         i = max(i, 0)
         j = max(j, 0)
-        if isinstance(other, self.__class__):
-            self.data[i:j] = other.data
+        self._forget(self.data[i:j])
+        if isinstance(other, CollectionStore):
+            self.data[i:j] = other._items()
         elif isinstance(other, type(self.data)):
             self.data[i:j] = other
         else:
             self.data[i:j] = list(other)
 
     def __delslice__(self, i, j):
+        if self._views:
+            self._detach_views()
         i = max(i, 0)
         j = max(j, 0)
+        self._forget(self.data[i:j])
         del self.data[i:j]
 
+    def __cast_segments(self, other):
+        if isinstance(other, CollectionStore):
+            return other._get_segments()
+        # lists are copied, as they are not tracked
+        other = list(other)
+        return [(other, 0, len(other), None)]
+
     def __add__(self, other):
-        if isinstance(other, self.__class__):
-            return self.__class__(self.store_class, self.data + other.data)
-        elif isinstance(other, type(self.data)):
-            return self.__class__(self.store_class, self.data + other)
-        else:
-            return self.__class__(self.store_class, self.data + list(other))
+        return self._view(self._get_segments() + self.__cast_segments(other))
 
     def __radd__(self, other):
-        if isinstance(other, self.__class__):
-            return self.__class__(self.store_class, other.data + self.data)
-        elif isinstance(other, type(self.data)):
-            return self.__class__(self.store_class, other + self.data)
-        else:
-            return self.__class__(self.store_class, list(other) + self.data)
+        return self._view(self.__cast_segments(other) + self._get_segments())
 
     def __iadd__(self, other):
-        if isinstance(other, self.__class__):
-            self.data += other.data
+        if self._views:
+            self._detach_views()
+        if isinstance(other, CollectionStore):
+            self.data += other._items()
         elif isinstance(other, type(self.data)):
             self.data += other
         else:
@@ -413,49 +1050,70 @@ class CollectionStore(Store, list):
         return self
 
     def __mul__(self, n):
-        return self.__class__(self.store_class, self.data*n)
+        return self._view(self._get_segments() * max(n, 0))
 
     __rmul__ = __mul__
 
     def __imul__(self, n):
+        if self._views:
+            self._detach_views()
+        if n <= 0:
+            self._embedded_stores_cache.clear()
         self.data *= n
         return self
 
     def append(self, item):
+        if self._views:
+            self._detach_views()
         self.data.append(item)
 
     def insert(self, i, item):
+        if self._views:
+            self._detach_views()
         self.data.insert(i, item)
 
     def pop(self, i=-1):
-        return self.data.pop(i)
+        if self._views:
+            self._detach_views()
+        item = self.data.pop(i)
+        self._forget([item])
+        return item
 
     def remove(self, item):
-        self.data.remove(item)
+        if self._views:
+            self._detach_views()
+        i = self.data.index(item)
+        self._forget([self.data[i]])
+        del self.data[i]
 
     def count(self, item):
-        return self.data.count(item)
+        return self._items().count(item)
 
     def index(self, item, *args):
-        return self.data.index(item, *args)
+        return self._items().index(item, *args)
 
     def reverse(self):
+        if self._views:
+            self._detach_views()
         self.data.reverse()
 
     def sort(self, *args, **kwds):
+        if self._views:
+            self._detach_views()
         self.data.sort(*args, **kwds)
 
     def extend(self, other):
-        if isinstance(other, self.__class__):
-            self.data.extend(other.data)
+        if self._views:
+            self._detach_views()
+        if isinstance(other, CollectionStore):
+            self.data.extend(other._items())
         else:
             self.data.extend(other)
 
 
 class BooleanField(Field):
     """Handles the boolean values"""
-    def get(self, dct):
-        value = super(BooleanField, self).get(dct)
+    def convert(self, value):
         if value == 'true' or value is True:
             return True
         elif value == 'false' or value is False:
@@ -466,29 +1124,25 @@ class BooleanField(Field):
 
 class DateField(Field):
     """Handles date values - returns datetime object"""
-    def get(self, dct):
-        value = super(DateField, self).get(dct)
+    def convert(self, value):
         return iso8601.parse_date(value)
 
 
 class IntField(Field):
     """Handles integer values - returns int"""
-    def get(self, dct):
-        value = super(IntField, self).get(dct)
+    def convert(self, value):
         return int(value)
 
 
 class FloatField(Field):
     """Handles float values - returns float"""
-    def get(self, dct):
-        value = super(FloatField, self).get(dct)
+    def convert(self, value):
         return float(value)
 
 
 class LongIntField(Field):
     """Handles long integer values - returns long"""
-    def get(self, dct):
-        value = super(LongIntField, self).get(dct)
+    def convert(self, value):
         if isinstance(value, basestring):
             # Reaktor inconsistently returns ISBN that may contain dashes or control character.
             # Make sure barrel doesn't get in trouble because of that.
@@ -502,8 +1156,7 @@ class SplitField(Field):
         super(SplitField, self).__init__(target, target_sep=target_sep, default=default)
         self.value_sep = value_sep
 
-    def get(self, dct):
-        value = super(SplitField, self).get(dct)
+    def convert(self, value):
         # value might be the default, in which would probably already be a list
         if isinstance(value, list):
             return value
@@ -515,6 +1168,5 @@ class SplitField(Field):
 # Kept here for the better __future__.
 # class MoneyField(Field):
 #     """Handles money dictionary values - amount and currency. Expects a dictionary. Returns `Money` object"""
-#     def get(self, dct):
-#         value = super(MoneyField, self).get(dct)
+#     def convert(self, value):
 #         return Money(**value)
@@ -0,0 +1,524 @@
+"""Micro benchmarks for the hot paths and the memory usage of barrel.
+
+Run them with::
+
+    python -m barrel.benchmarks
+
+Timings are reported in microseconds and operations per second, with the
+objects allocated per operation. Results can be saved as a baseline, and
+checked against it to catch regressions::
+
+    python -m barrel.benchmarks --save
+    python -m barrel.benchmarks --check --tolerance 0.2
+
+Timings depend on the speed and the load of the machine, so they are checked
+relative to the timing of `calibration`, a pure Python loop measured along
+each benchmark, rather than in microseconds. The objects allocated and the
+plain values, e.g. the memory used, are checked as is.
+"""
+from . import (Field, Store, CollectionStore, EmbeddedStoreField, BooleanField, DateField,
+               FloatField, IntField, LongIntField, SplitField, deep_get, simple_get)
+from . import cache, config, keys, rpc
+from .testing import StandInServer
+from timeit import Timer
+import argparse
+import gc
+import json
+import sys
+
+
+DATA = {
+    "userID": 32217171,
+    "isbn": "978-3-16-148410-0",
+    "passwordExpiration": "2014-01-25T12:00:00+01:00",
+    "settings": {
+        "com.bookpac.user.settings.locale": "de",
+        "com.bookpac.user.settings.shop.country": "DE",
+        "com.bookpac.user.settings.shop.gender": "MALE",
+    },
+}
+
+
+def legacy_deep_get(deep_key, dictionary, sep=':'):
+    """`deep_get` as it was before targets were compiled."""
+    keys = deep_key.split(sep)
+    while keys:
+        dictionary = dictionary[keys.pop(0)]
+    return dictionary
+
+
+def legacy_field_get(field, dct):
+    """`Field.get` as it was before targets were compiled."""
+    try:
+        if field.target and field.target_sep in field.target:
+            return legacy_deep_get(field.target, dct, field.target_sep)
+        else:
+            return simple_get(field.target, dct)
+    except KeyError, err:
+        if field.default is not None:
+            return field.default
+        else:
+            raise err
+
+
+class LegacyStore(Store):
+    """Store dispatching fields through `__getattribute__`, as it was
+    before fields became descriptors.
+    """
+    def __getattribute__(self, name):
+        attr = super(Store, self).__getattribute__(name)
+        if isinstance(attr, (EmbeddedStoreField,)):
+            return attr.__get__(self, type(self))
+        elif isinstance(attr, (Field,)):
+            try:
+                return attr.get(self.data)
+            except (KeyError,):
+                raise AttributeError(attr.target)
+        else:
+            return attr
+
+
+class User(Store):
+    id = Field(target='userID')
+    locale = Field(target='settings:com.bookpac.user.settings.locale')
+
+
+class Document(Store):
+    isbn = LongIntField(target='isbn')
+    password_expiration = DateField(target='passwordExpiration')
+
+
+class CachedDocument(Document):
+    cache_values = True
+
+
+class Settings(Store):
+    id = Field(target='userID')
+    locale = Field(target='settings:com.bookpac.user.settings.locale')
+    country = Field(target='settings:com.bookpac.user.settings.shop.country')
+    gender = Field(target='settings:com.bookpac.user.settings.shop.gender')
+    zipcode = Field(target='settings:com.bookpac.user.settings.shop.zipcode')
+
+
+class Price(Store):
+    amount = FloatField(target='money:amount')
+
+
+class CompactUser(User):
+    compact = True
+
+
+class LegacyUser(LegacyStore):
+    id = Field(target='userID')
+    locale = Field(target='settings:com.bookpac.user.settings.locale')
+
+
+class ProfileSettings(Store):
+    locale = Field(target='com.bookpac.user.settings.locale')
+    country = Field(target='com.bookpac.user.settings.shop.country')
+
+
+class Identifier(Store):
+    service = Field(target='authenticationServiceName')
+    uid = Field(target='identifier')
+
+
+class Profile(Store):
+    id = IntField(target='userID')
+    isbn = LongIntField(target='isbn')
+    password_expiration = DateField(target='passwordExpiration')
+    tags = SplitField(target='tags')
+    active = BooleanField(target='active')
+    locale = Field(target='settings:com.bookpac.user.settings.locale')
+    settings = EmbeddedStoreField(target='settings', store_class=ProfileSettings)
+    identifiers = EmbeddedStoreField(target='externalUserIdentifiers',
+                                     store_class=Identifier, is_array=True)
+
+
+def payload(count):
+    """Returns `count` user documents shaped like `DATA`, each one different."""
+    users = []
+    for i in xrange(count):
+        user = dict(DATA, userID=DATA['userID'] + i, active='true' if i % 2 else 'false')
+        user['isbn'] = '978-3-16-%06d-0' % i
+        user['passwordExpiration'] = '2014-01-%02dT12:00:00+01:00' % (i % 28 + 1)
+        user['tags'] = 'fiction,crime,%s' % i
+        user['settings'] = dict(DATA['settings'])
+        user['externalUserIdentifiers'] = [
+            {'authenticationServiceName': 'facebook', 'identifier': str(i)},
+            {'authenticationServiceName': 'google', 'identifier': str(i * 2)},
+        ]
+        users.append(user)
+    return users
+
+
+PROFILE = payload(1)[0]
+
+
+def instance_size(store):
+    """Returns the bytes used by the store instance and its caches,
+    its data excluded.
+    """
+    size = sys.getsizeof(store)
+    for referent in gc.get_referents(store):
+        if isinstance(referent, dict) and referent is not store.data:
+            size += sys.getsizeof(referent)
+            # the instance dict holds the caches of non compact stores
+            for value in referent.itervalues():
+                if isinstance(value, dict) and value is not store.data:
+                    size += sys.getsizeof(value)
+    return size
+
+
+class Timing(float):
+    """Median time per call in microseconds, with the objects allocated per
+    call, None if unknown.
+    """
+    allocated = None
+
+
+def allocated(fn, number=100):
+    """Returns the objects tracked by the garbage collector allocated per call
+    and still referenced after it, e.g. the result and what it caches.
+    Objects freed by the call, or not tracked such as strings and numbers,
+    are not counted.
+    """
+    fn()
+    results = []
+    gc.disable()
+    try:
+        start = len(gc.get_objects())
+        for i in xrange(number):
+            results.append(fn())
+        return float(len(gc.get_objects()) - start) / number
+    finally:
+        gc.enable()
+
+
+def bench(fn, number=100000, repeat=5):
+    """Returns the median time per call, in microseconds."""
+    times = sorted(Timer(fn).repeat(repeat=repeat, number=number))
+    timing = Timing(times[len(times) // 2] / number * 1e6)
+    timing.allocated = allocated(fn, min(number, 100))
+    return timing
+
+
+class Calibration(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, key):
+        return self.data[key]
+
+
+def calibration(data=DATA):
+    """Pure Python work of the kind of the hot paths of barrel, i.e. calls,
+    attribute and dict lookups and small allocations, not using barrel so
+    that the timings relative to it only change with the code of barrel.
+    Keep it as is, or the baselines are to be saved again.
+    """
+    calibration = Calibration(data)
+    settings = calibration.get('settings')
+    return [calibration.get('userID'), calibration.get('isbn'),
+            settings['com.bookpac.user.settings.locale'],
+            settings.get('com.bookpac.user.settings.shop.zipcode')]
+
+
+def bench_field_get():
+    simple = Field(target='userID')
+    deep = Field(target='settings:com.bookpac.user.settings.locale')
+    return [
+        ('simple target, legacy', bench(lambda: legacy_field_get(simple, DATA))),
+        ('simple target, compiled', bench(lambda: simple.get(DATA))),
+        ('deep target, legacy', bench(lambda: legacy_field_get(deep, DATA))),
+        ('deep target, compiled', bench(lambda: deep.get(DATA))),
+    ]
+
+
+def bench_store_getattr():
+    user, legacy = User(DATA), LegacyUser(DATA)
+    return [
+        ('field, legacy', bench(lambda: legacy.id)),
+        ('field, descriptor', bench(lambda: user.id)),
+        ('deep field, legacy', bench(lambda: legacy.locale)),
+        ('deep field, descriptor', bench(lambda: user.locale)),
+        ('plain attribute, legacy', bench(lambda: legacy.data)),
+        ('plain attribute, descriptor', bench(lambda: user.data)),
+    ]
+
+
+def bench_values_cache():
+    document, cached = Document(DATA), CachedDocument(DATA)
+    return [
+        ('DateField, uncached', bench(lambda: document.password_expiration)),
+        ('DateField, cached', bench(lambda: cached.password_expiration)),
+        ('LongIntField, uncached', bench(lambda: document.isbn)),
+        ('LongIntField, cached', bench(lambda: cached.isbn)),
+    ]
+
+
+def bench_projection():
+    settings = Settings(DATA)
+    return [
+        ('dict(store)', bench(lambda: dict(settings), number=20000)),
+        ('store.to_dict()', bench(lambda: settings.to_dict(), number=20000)),
+    ]
+
+
+def bench_column():
+    try:
+        import numpy
+    except ImportError:
+        return []
+    prices = CollectionStore(Price, [{'money': {'amount': i * 0.01}} for i in xrange(10000)])
+    return [
+        ('sum over stores, 10k items', bench(lambda: sum(p.amount for p in prices), number=10)),
+        ('column sum, 10k items', bench(lambda: prices.column('amount').sum(), number=10)),
+    ]
+
+
+def bench_collection_iter():
+    items = [{'money': {'amount': i * 0.01}} for i in xrange(10000)]
+    results = []
+    for policy in ('strong', 'weak', 'none', 1000):
+        prices = CollectionStore(Price, items, cache_policy=policy)
+        results.append(('iterate 10k items, %s cache' % policy,
+                        bench(lambda: [p for p in prices], number=10)))
+    return results
+
+
+def bench_collection_slice():
+    prices = CollectionStore(Price, [{'money': {'amount': i * 0.01}} for i in xrange(10000)])
+    # the item stores of the page are already cached by the collection
+    list(prices[5000:5020])
+    return [
+        ('read page of 20 out of 10k, copy', bench(
+            lambda: list(CollectionStore(Price, prices.data[5000:5020])), number=10000)),
+        ('read page of 20 out of 10k, view', bench(
+            lambda: list(prices[5000:5020]), number=10000)),
+        ('10k + 10k items, copy', bench(
+            lambda: CollectionStore(Price, prices.data + prices.data), number=1000)),
+        ('10k + 10k items, view', bench(lambda: prices + prices, number=1000)),
+    ]
+
+
+def bench_store_size():
+    eager = User(DATA)
+    # caches used to be created by `Store.__init__`
+    eager._embedded_stores_cache = {}
+    eager._values_cache = {}
+    return [
+        ('eager caches, bytes per instance', instance_size(eager)),
+        ('lazy caches, bytes per instance', instance_size(User(DATA))),
+        ('compact, bytes per instance', instance_size(CompactUser(DATA))),
+        ('init, lazy caches', bench(lambda: User(DATA))),
+        ('init, compact', bench(lambda: CompactUser(DATA))),
+    ]
+
+
+def bench_call_key():
+    short_args = [32217171, u'de', u'DE']
+    long_args = [[unicode(i) for i in xrange(32217171, 32217371)], u'de']
+    text_args = [u'Der Name der Rose \xe9dition \u2013 Umberto Eco' * 4]
+    return [
+        ('short args, cache.call_key', bench(
+            lambda: cache.call_key('Document', 'get', short_args))),
+        ('short args, keys.call_key', bench(
+            lambda: keys.call_key('Document', 'get', short_args))),
+        ('200 ids, cache.call_key', bench(
+            lambda: cache.call_key('Document', 'get', long_args), number=1000)),
+        ('200 ids, keys.call_key', bench(
+            lambda: keys.call_key('Document', 'get', long_args), number=1000)),
+        ('unicode text, cache.call_key', bench(
+            lambda: cache.call_key('Document', 'search', text_args), number=10000)),
+        ('unicode text, keys.call_key', bench(
+            lambda: keys.call_key('Document', 'search', text_args), number=10000)),
+    ]
+
+
+class RemoteUser(User, rpc.RpcMixin):
+    interface = 'WSUser'
+
+
+def bench_rpc_pool():
+    server = StandInServer({'WSUser.getUser': lambda id: dict(DATA, userID=id)}).start()
+    config.configure(REAKTOR=server.client_factory())
+    try:
+        call = lambda: RemoteUser.signature(method='getUser', args=[42])
+        config.configure(REAKTOR_POOL_SIZE=0)
+        unpooled = bench(call, number=300)
+        config.configure(REAKTOR_POOL_SIZE=8)
+        pooled = bench(call, number=300)
+        rpc.get_client_pool().clear()
+    finally:
+        server.stop()
+        for name in ('REAKTOR', 'REAKTOR_POOL_SIZE'):
+            config.config.pop(name)
+        rpc.reset_client_pool(config)
+    return [
+        ('stand-in call, new connection', unpooled),
+        ('stand-in call, pooled connection', pooled),
+    ]
+
+
+def bench_deep_get():
+    deep_key = 'settings:com.bookpac.user.settings.locale'
+    return [
+        ('deep_get, legacy', bench(lambda: legacy_deep_get(deep_key, DATA))),
+        ('deep_get', bench(lambda: deep_get(deep_key, DATA))),
+    ]
+
+
+def bench_typed_fields():
+    profile = Profile(PROFILE)
+    return [
+        ('IntField', bench(lambda: profile.id)),
+        ('LongIntField', bench(lambda: profile.isbn)),
+        ('DateField', bench(lambda: profile.password_expiration, number=20000)),
+        ('SplitField', bench(lambda: profile.tags)),
+        ('BooleanField', bench(lambda: profile.active)),
+    ]
+
+
+def bench_embedded_stores():
+    profile = Profile(PROFILE)
+    return [
+        ('embedded store', bench(lambda: profile.settings)),
+        ('field of embedded store', bench(lambda: profile.settings.locale)),
+        ('deep field', bench(lambda: profile.locale)),
+        ('embedded store array', bench(lambda: profile.identifiers)),
+        ('item of embedded store array', bench(lambda: profile.identifiers[1].uid)),
+        ('embedded store, new instance', bench(lambda: Profile(PROFILE).settings)),
+    ]
+
+
+def bench_collection_scale():
+    results = []
+    for count in (1000, 10000):
+        users = payload(count)
+        profiles = CollectionStore(Profile, users)
+        number = 100000 / count
+        results.extend([
+            ('iterate %s profiles' % count, bench(
+                lambda: [p for p in profiles], number=number)),
+            ('read id of %s profiles' % count, bench(
+                lambda: [p.id for p in profiles], number=number)),
+            ('read id of %s new profiles' % count, bench(
+                lambda: [p.id for p in CollectionStore(Profile, users)], number=number)),
+            ('read locale of %s embedded settings' % count, bench(
+                lambda: [p.settings.locale for p in profiles], number=number)),
+        ])
+    return results
+
+
+BENCHMARKS = [
+    bench_field_get,
+    bench_deep_get,
+    bench_store_getattr,
+    bench_typed_fields,
+    bench_embedded_stores,
+    bench_values_cache,
+    bench_projection,
+    bench_column,
+    bench_collection_iter,
+    bench_collection_scale,
+    bench_collection_slice,
+    bench_store_size,
+    bench_call_key,
+    bench_rpc_pool,
+]
+
+
+def run(benchmarks=BENCHMARKS):
+    """Runs the benchmarks and returns their results by benchmark and case
+    names: timings in microseconds with their operations per second, objects
+    allocated per operation and time relative to `calibration`, or plain
+    values. The calibration is timed before and after each benchmark.
+    """
+    results = {}
+    for benchmark in benchmarks:
+        cases = results[benchmark.__name__] = {}
+        before = bench(calibration)
+        timings = benchmark()
+        unit = (before + bench(calibration)) / 2
+        for name, value in timings:
+            if isinstance(value, float):
+                cases[name] = {'usec': value, 'ops_per_sec': 1e6 / value if value else None,
+                               'allocated': getattr(value, 'allocated', None),
+                               'relative': value / unit}
+            else:
+                cases[name] = {'value': value}
+    return results
+
+
+def regressions(results, baseline, tolerance=0.25):
+    """Returns the cases slower relative to `calibration` than in the
+    baseline, or allocating more objects or using more memory, by more than
+    `tolerance`, as `(benchmark, case, metric, baseline value, value)` tuples.
+    Absolute timings are not checked. Cases missing from either side are
+    ignored.
+    """
+    found = []
+    for benchmark, cases in sorted(results.iteritems()):
+        for name, measures in sorted(cases.iteritems()):
+            expected = baseline.get(benchmark, {}).get(name, {})
+            for metric in ('relative', 'allocated', 'value'):
+                value, reference = measures.get(metric), expected.get(metric)
+                if value is None or reference is None:
+                    continue
+                if value > reference * (1 + tolerance):
+                    found.append((benchmark, name, metric, reference, value))
+    return found
+
+
+def report(results, benchmarks=BENCHMARKS):
+    for benchmark in benchmarks:
+        print(benchmark.__name__)
+        for name, measures in sorted(results[benchmark.__name__].iteritems()):
+            if 'usec' not in measures:
+                print('  %-45s %10d' % (name, measures['value']))
+                continue
+            allocated = measures['allocated']
+            print('  %-45s %10.3f usec %12.0f ops/s %12s %10.2fx' % (
+                name, measures['usec'], measures['ops_per_sec'] or 0,
+                'n/a' if allocated is None else '%.1f obj/op' % allocated,
+                measures['relative']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks of barrel.")
+    parser.add_argument('names', nargs='*', help="run only the benchmarks containing these names")
+    parser.add_argument('--baseline', default='.benchmarks.json',
+                        help="baseline file, .benchmarks.json by default")
+    parser.add_argument('--save', action='store_true', help="save the results as baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="fail if the results regress from the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="relative slowdown tolerated by --check, 0.25 by default")
+    args = parser.parse_args(argv)
+    benchmarks = [benchmark for benchmark in BENCHMARKS if not args.names or
+                  any(name in benchmark.__name__ for name in args.names)]
+    results = run(benchmarks)
+    report(results, benchmarks)
+    if args.check:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for benchmark, name, metric, reference, value in found:
+            print('REGRESSION %s: %s %s %.3f -> %.3f' % (benchmark, name, metric, reference, value))
+        if found:
+            return 1
+    if args.save:
+        baseline = {}
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except IOError:
+            pass
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
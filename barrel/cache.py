@@ -1,6 +1,11 @@
-from collections import namedtuple
+from .signals import cache_call, cache_many
+from .utils import Histogram, LRUCache, SingleFlight, ThreadPool
+from collections import defaultdict, namedtuple
+from functools import partial
 import contextlib
 import logging
+import threading
+import time
 import unicodedata
 
 
@@ -32,13 +37,180 @@ def call_key(cls_or_module, fn, args, sep=','):
 
 
 needs_cache_always = lambda x: True
+timer = time.time
 
 
-class Cacher(namedtuple('Cacher', 'engine, keygen, needs_cache, duration')):
+def function_name(fn):
+    cls_or_module = fn.im_self.__name__ if hasattr(fn, 'im_self') else fn.__module__
+    return '%s.%s' % (cls_or_module, fn.__name__)
+
+
+class LocalLock(object):
+    """Protects against cache stampedes within the process: a single thread
+    computes a missing value while the other ones wait for it, at most
+    `timeout` seconds before computing it themselves.
+    """
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.flights = SingleFlight()
+
+    def __call__(self, engine, key, fetch, compute):
+        def fetch_or_compute():
+            # the value may have been cached since the caller missed it
+            value = fetch()
+            return compute() if value is empty else value
+        return self.flights.do(key, fetch_or_compute, self.timeout)
+
+
+class LeaseLock(object):
+    """Protects against cache stampedes across processes, using a lease
+    taken with the `add` method of the cache engine: the caller getting the
+    lease computes a missing value while the other ones poll the engine
+    every `interval` seconds for it, at most `timeout` seconds before
+    computing it themselves. The lease expires after `lease` seconds,
+    in case its holder dies, and defaults to `timeout`. When the lease is
+    released without a cached value, e.g. if the computation failed or its
+    result is not to be cached, the waiting callers take the lease in turn.
+    """
+    def __init__(self, timeout=10, lease=None, interval=0.05):
+        self.timeout = timeout
+        self.lease = lease or timeout
+        self.interval = interval
+
+    def __call__(self, engine, key, fetch, compute):
+        lease_key = '%s:lease' % key
+        deadline = time.time() + self.timeout
+        while True:
+            if engine.add(lease_key, 1, self.lease):
+                try:
+                    # the value may have been cached since the caller missed it
+                    value = fetch()
+                    return compute() if value is empty else value
+                finally:
+                    engine.delete(lease_key)
+            value = self.wait(engine, lease_key, fetch, deadline)
+            if value is not empty:
+                return value
+            if time.time() >= deadline:
+                return compute()
+
+    def wait(self, engine, lease_key, fetch, deadline):
+        """Polls the engine for the value until the lease is released or the
+        deadline is reached. Returns the value, or `empty` if it is missing.
+        """
+        while time.time() < deadline:
+            time.sleep(self.interval)
+            value = fetch()
+            if value is not empty:
+                return value
+            if engine.get(lease_key) is None:
+                # the value may have been cached right before the release
+                return fetch()
+        return empty
+
+
+class Refresher(object):
+    """Recomputes stale values on a bounded thread pool. A key is refreshed
+    once at a time, and refreshes are skipped while the pool queue is full.
+    """
+    def __init__(self, workers=2, queue_size=100):
+        self.pool = ThreadPool(workers, queue_size)
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def __call__(self, key, compute):
+        """Returns the `Future` of the refresh, or None if it is skipped."""
+        with self.lock:
+            if key in self.pending:
+                return None
+            self.pending.add(key)
+        future = self.pool.submit(compute)
+        if future is None:
+            logger.warning("refresh skipped: %s", key)
+            self.done(key, future)
+        else:
+            future.add_done_callback(partial(self.done, key))
+        return future
+
+    def done(self, key, future):
+        with self.lock:
+            self.pending.discard(key)
+        if future is not None and future.error is not None:
+            logger.error("refresh failed: %s", key, exc_info=future.error)
+
+
+default_refresher = None
+
+
+def get_default_refresher():
+    global default_refresher
+    if default_refresher is None:
+        default_refresher = Refresher()
+    return default_refresher
+
+
+class Cacher(namedtuple('Cacher', 'engine, keygen, needs_cache, duration, lock, codec, '
+                                  'hard_duration, refresher')):
+    """Caches function calls. With a `lock` (see `LocalLock` and `LeaseLock`),
+    a single caller computes a missing value while the other ones wait for it.
+    With a `codec` (see `barrel.codec.StoreCodec`), values are encoded before
+    being handed to the engine.
+
+    With a `hard_duration`, values are kept that long, and `duration` only
+    makes them stale: stale values are returned while the `refresher`
+    recomputes them in the background.
+    """
+    def __new__(cls, engine, keygen, needs_cache, duration, lock=None, codec=None,
+                hard_duration=None, refresher=None):
+        if hard_duration is not None and refresher is None:
+            refresher = get_default_refresher()
+        return super(Cacher, cls).__new__(cls, engine, keygen, needs_cache, duration, lock,
+                                          codec, hard_duration, refresher)
+
     def __call__(self, fn, *args, **kwargs):
         """Handles caching for a function call. It builds the cache key using the instance `keygen`.
         With the instance `needs_cache` callable, the cache may be discarded.
+        The call is measured only if the `cache_call` signal has receivers.
         """
+        if not cache_call.receivers:
+            return self.call(fn, args, kwargs)
+        record = {'outcome': 'hit'}
+        start = timer()
+        cache_val = self.call(fn, args, kwargs, record)
+        record['time'] = timer() - start
+        cache_call.send(self, fn=fn, **record)
+        return cache_val
+
+    def call(self, fn, args, kwargs, record=None):
+        """Handles caching for a function call, filling the `record` dict with
+        the key, outcome and timings of the call if given.
+        """
+        cache_key = self.key(fn, args, kwargs)
+        if record is None:
+            cache_val, stale = self.lookup(cache_key)
+        else:
+            record['key'] = cache_key
+            start = timer()
+            cache_val, stale = self.lookup(cache_key)
+            record['get_time'] = timer() - start
+        if stale:
+            logger.info("cache stale: %s", cache_key)
+            if record is not None:
+                record['outcome'] = 'stale'
+            self.refresh(cache_key, fn, args, kwargs)
+        elif cache_val is empty:
+            compute = partial(self.compute, cache_key, fn, args, kwargs, record)
+            if self.lock is None:
+                cache_val = compute()
+            else:
+                fetch = partial(self.fetch, cache_key)
+                cache_val = self.lock(self.engine, cache_key, fetch, compute)
+        else:
+            logger.info("cache hit: %s", cache_key)
+        return cache_val
+
+    def key(self, fn, args, kwargs):
+        """Builds the cache key of a function call using the instance `keygen`."""
         # needs casting to list in case there is a need to append
         keygen_args = list(args)
         # beware that dictionaries are not ordered, and
@@ -46,17 +218,132 @@ class Cacher(namedtuple('Cacher', 'engine, keygen, needs_cache, duration')):
         for key in sorted(kwargs):
             keygen_args.append(kwargs[key])
         cls_or_module = fn.im_self.__name__ if hasattr(fn, 'im_self') else fn.__module__
-        cache_key = self.keygen(cls_or_module, fn.__name__, keygen_args)
+        return self.keygen(cls_or_module, fn.__name__, keygen_args)
+
+    def many(self, fn, calls, loader=None):
+        """Handles caching for many calls of a function at once. `calls` is a
+        list of positional argument tuples, a non-tuple item being the single
+        argument of a call. Cache keys are the ones of single calls.
+        Cached values are fetched with a single `get_many`. The missing ones are
+        computed with a single call of `loader`, given the argument tuples of the
+        misses and returning their values in the same order, then cached with a
+        single `set_many`. Without `loader`, the function is called for each miss.
+        Returns the values in the order of `calls`. The batch is measured only
+        if the `cache_many` signal has receivers.
+        """
+        measured = bool(cache_many.receivers)
+        if measured:
+            start = timer()
+        calls = [args if isinstance(args, tuple) else (args,) for args in calls]
+        keys = [self.key(fn, args, {}) for args in calls]
+        cached = self.engine.get_many(keys)
+        if measured:
+            record = {'hit': len(cached), 'stale': 0, 'miss': 0, 'no_cache': 0,
+                      'get_time': timer() - start}
+        found = {}
+        for key, args in zip(keys, calls):
+            if key in cached and key not in found:
+                found[key], stale = self.unwrap(cached[key])
+                if stale:
+                    self.refresh(key, fn, args, {})
+                    if measured:
+                        record['stale'] += 1
+        if measured:
+            # stale values are counted apart from the hits
+            record['hit'] -= record['stale']
+        missing = {}
+        for key, args in zip(keys, calls):
+            if key not in found and key not in missing:
+                missing[key] = args
+        if missing:
+            missing_keys = missing.keys()
+            missing_calls = [missing[key] for key in missing_keys]
+            if measured:
+                compute_start = timer()
+            if loader is None:
+                values = [fn(*args) for args in missing_calls]
+            else:
+                values = loader(missing_calls)
+            to_cache = {}
+            for key, value in zip(missing_keys, values):
+                found[key] = value
+                if self.needs_cache(value):
+                    to_cache[key] = value
+            logger.info("cache miss: %r", to_cache.keys())
+            if measured:
+                record['compute_time'] = timer() - compute_start
+                record['miss'] = len(to_cache)
+                record['no_cache'] = len(missing) - len(to_cache)
+                set_start = timer()
+            if to_cache:
+                to_cache = dict((key, self.wrap(value)) for key, value in to_cache.iteritems())
+                self.engine.set_many(to_cache, self.timeout)
+            if measured:
+                record['set_time'] = timer() - set_start
+        if measured:
+            record['time'] = timer() - start
+            cache_many.send(self, fn=fn, **record)
+        return [found[key] for key in keys]
+
+    @property
+    def timeout(self):
+        """Duration the engine keeps the values for."""
+        return self.duration if self.hard_duration is None else self.hard_duration
+
+    def wrap(self, cache_val):
+        """Prepares a value for the engine: encodes it and adds its soft expiry."""
+        if self.codec is not None:
+            cache_val = self.codec.encode(cache_val)
+        if self.hard_duration is not None:
+            cache_val = (time.time() + self.duration, cache_val)
+        return cache_val
+
+    def unwrap(self, cache_val):
+        """Returns a value from the engine, and whether it is stale."""
+        stale = False
+        if self.hard_duration is not None:
+            expiry, cache_val = cache_val
+            stale = expiry <= time.time()
+        if self.codec is not None:
+            cache_val = self.codec.decode(cache_val)
+        return cache_val, stale
+
+    def lookup(self, cache_key):
+        """Returns the cached value, or `empty`, and whether it is stale."""
         cache_val = self.engine.get(cache_key, empty)
         if cache_val is empty:
+            return empty, False
+        return self.unwrap(cache_val)
+
+    def fetch(self, cache_key):
+        """Returns the cached value, or `empty`."""
+        return self.lookup(cache_key)[0]
+
+    def refresh(self, cache_key, fn, args, kwargs):
+        """Schedules the computation of a stale value."""
+        return self.refresher(cache_key, partial(self.compute, cache_key, fn, args, kwargs))
+
+    def compute(self, cache_key, fn, args, kwargs, record=None):
+        """Calls the function and caches its result if needed."""
+        if record is None:
+            cache_val = fn(*args, **kwargs)
+        else:
+            start = timer()
             cache_val = fn(*args, **kwargs)
-            if self.needs_cache(cache_val):
-                logger.info("cache miss: %s" % cache_key)
-                self.engine.set(cache_key, cache_val, self.duration)
+            record['compute_time'] = timer() - start
+        if self.needs_cache(cache_val):
+            logger.info("cache miss: %s", cache_key)
+            if record is None:
+                self.engine.set(cache_key, self.wrap(cache_val), self.timeout)
             else:
-                logger.info("no cache: %s" % cache_key)
+                record['outcome'] = 'miss'
+                start = timer()
+                self.engine.set(cache_key, self.wrap(cache_val), self.timeout)
+                record['set_time'] = timer() - start
         else:
-            logger.info("cache hit: %s" % cache_key)
+            logger.info("no cache: %s", cache_key)
+            if record is not None:
+                record['outcome'] = 'no_cache'
         return cache_val
 
 
@@ -76,11 +363,209 @@ class CacheClearer(namedtuple('Cacher', 'engine, keygen')):
         # so make no assumption from the proxied function.
         cache_keys = self.keygen(*keygen_args)
         self.engine.delete_many(cache_keys)
-        logger.info("cache clear: %s" % repr(cache_keys))
+        logger.info("cache clear: %r", cache_keys)
+
+
+class CacheStats(object):
+    """Aggregates the `cache_call` and `cache_many` signals per function:
+    outcome counters (`hit`, `stale`, `miss`, `no_cache`) and histograms of
+    the timings (`time`, `get_time`, `compute_time`, `set_time`), in seconds.
+    """
+    outcomes = ('hit', 'stale', 'miss', 'no_cache')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: dict.fromkeys(self.outcomes, 0))
+        self.histograms = defaultdict(lambda: defaultdict(Histogram))
+
+    def connect(self):
+        cache_call.connect(self.record_call)
+        cache_many.connect(self.record_many)
+        return self
+
+    def disconnect(self):
+        cache_call.disconnect(self.record_call)
+        cache_many.disconnect(self.record_many)
+
+    def record_call(self, cacher, fn, key, outcome, **timings):
+        name = function_name(fn)
+        with self.lock:
+            self.counters[name][outcome] += 1
+            self.add_timings(name, timings)
+
+    def record_many(self, cacher, fn, **record):
+        name = function_name(fn)
+        with self.lock:
+            counters = self.counters[name]
+            for outcome in self.outcomes:
+                counters[outcome] += record.pop(outcome)
+            self.add_timings(name, record)
+
+    def add_timings(self, name, timings):
+        histograms = self.histograms[name]
+        for timing, value in timings.iteritems():
+            histograms[timing].add(value)
+
+    def stats(self):
+        """Returns the counters and timing summaries, by function name."""
+        with self.lock:
+            stats = {}
+            for name, counters in self.counters.iteritems():
+                stats[name] = dict(counters)
+                calls = sum(counters.itervalues())
+                stats[name]['hit_ratio'] = (
+                    float(counters['hit'] + counters['stale']) / calls if calls else 0.0)
+                for timing, histogram in self.histograms[name].iteritems():
+                    stats[name][timing] = histogram.to_dict()
+            return stats
+
+
+class MemoryEngine(object):
+    """In-process cache engine keeping at most `maxsize` values, the least
+    recently used ones being dropped first. Values expire after the duration
+    given when setting them, no duration meaning no expiry.
+    """
+    def __init__(self, maxsize=1024):
+        self.lock = threading.Lock()
+        self.values = LRUCache(maxsize)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                self.values.pop(key)
+                return default
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        with self.lock:
+            self.values[key] = (value, expires)
+
+    def add(self, key, value, timeout=None):
+        now = time.time()
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                return False
+            self.values[key] = (value, now + timeout if timeout else None)
+            return True
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key, empty)
+            if value is not empty:
+                values[key] = value
+        return values
+
+    def set_many(self, values, timeout=None):
+        for key, value in values.iteritems():
+            self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self.lock:
+            self.values.pop(key)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.values.pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class LayeredEngine(object):
+    """Cache engine serving the values from an in-process `local` engine
+    (a `MemoryEngine` by default) in front of a shared `remote` engine.
+    Values are kept locally at most `local_duration` seconds, which bounds
+    how long a process may serve a value deleted or changed by another one.
+    The hits of each tier are counted, see `stats`.
+    """
+    def __init__(self, remote, local=None, local_duration=10):
+        self.remote = remote
+        self.local = local if local is not None else MemoryEngine()
+        self.local_duration = local_duration
+        # counters are not locked, so they are approximate under contention
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+
+    def local_timeout(self, timeout):
+        if timeout and timeout < self.local_duration:
+            return timeout
+        return self.local_duration
+
+    def get(self, key, default=None):
+        value = self.local.get(key, empty)
+        if value is not empty:
+            self.local_hits += 1
+            return value
+        value = self.remote.get(key, empty)
+        if value is not empty:
+            self.remote_hits += 1
+            # the remaining duration of the remote value is unknown
+            self.local.set(key, value, self.local_duration)
+            return value
+        self.misses += 1
+        return default
+
+    def set(self, key, value, timeout=None):
+        self.remote.set(key, value, timeout)
+        self.local.set(key, value, self.local_timeout(timeout))
+
+    def get_many(self, keys):
+        values = self.local.get_many(keys)
+        self.local_hits += len(values)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            remote_values = self.remote.get_many(missing)
+            self.remote_hits += len(remote_values)
+            self.misses += len(missing) - len(remote_values)
+            if remote_values:
+                self.local.set_many(remote_values, self.local_duration)
+                values.update(remote_values)
+        return values
+
+    def set_many(self, values, timeout=None):
+        self.remote.set_many(values, timeout)
+        self.local.set_many(values, self.local_timeout(timeout))
+
+    def add(self, key, value, timeout=None):
+        # the remote engine is the only one to tell if the key exists
+        return self.remote.add(key, value, timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.remote.delete(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        self.local.delete_many(keys)
+        self.remote.delete_many(keys)
+
+    def stats(self):
+        """Returns the hit counts and ratios of each tier."""
+        lookups = self.local_hits + self.remote_hits + self.misses
+        remote_lookups = lookups - self.local_hits
+        return {
+            'local_hits': self.local_hits,
+            'remote_hits': self.remote_hits,
+            'misses': self.misses,
+            'local_hit_ratio': float(self.local_hits) / lookups if lookups else 0.0,
+            'remote_hit_ratio': (float(self.remote_hits) / remote_lookups
+                                 if remote_lookups else 0.0),
+        }
 
 
-def get_cacher(engine, keygen, needs_cache, duration):
-    return Cacher(engine, keygen, needs_cache, duration)
+def get_cacher(engine, keygen, needs_cache, duration, lock=None, codec=None,
+               hard_duration=None, refresher=None):
+    return Cacher(engine, keygen, needs_cache, duration, lock, codec, hard_duration, refresher)
 
 
 def get_cache_clearer(engine, keygen):
@@ -88,8 +573,10 @@ def get_cache_clearer(engine, keygen):
 
 
 @contextlib.contextmanager
-def caching(engine, keygen=call_key, needs_cache=needs_cache_always, duration=10):
-    cacher = get_cacher(engine, keygen, needs_cache, duration)
+def caching(engine, keygen=call_key, needs_cache=needs_cache_always, duration=10, lock=None,
+            codec=None, hard_duration=None, refresher=None):
+    cacher = get_cacher(engine, keygen, needs_cache, duration, lock, codec, hard_duration,
+                        refresher)
     try:
         yield cacher
     finally:
@@ -0,0 +1,102 @@
+"""Compact serialization of cached values: stores are encoded as their
+class path and their raw data only, instead of being pickled along with
+their caches and the prototype stores of their fields.
+"""
+from . import Store, CollectionStore
+from .utils import import_module
+import cPickle
+import marshal
+import zlib
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# tags of the encoded values
+STORE = 's'
+COLLECTION = 'c'
+LIST = 'l'
+VALUE = 'v'
+
+# serializer and compression flags, heading the payloads
+MARSHAL = 'm'
+MSGPACK = 'k'
+PICKLE = 'p'
+COMPRESSED = 'z'
+RAW = '-'
+
+
+def class_path(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+class StoreCodec(object):
+    """Encodes cached values to strings and back. `Store` and
+    `CollectionStore` values, and lists of them, are reduced to class paths
+    and raw data, serialized with `marshal` or `msgpack`. Values these
+    cannot serialize are pickled. Payloads longer than `compress_threshold`
+    bytes are compressed with zlib.
+    """
+    def __init__(self, serializer=MARSHAL, compress_threshold=1024, compress_level=1):
+        if serializer == MSGPACK and msgpack is None:
+            raise ImportError("msgpack is required by the msgpack serializer")
+        if serializer not in (MARSHAL, MSGPACK):
+            raise ValueError("Invalid serializer: %r" % (serializer,))
+        self.serializer = serializer
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.classes = {}
+
+    def resolve(self, path):
+        """Returns the class of the given path."""
+        cls = self.classes.get(path)
+        if cls is None:
+            cls = self.classes[path] = import_module(path)
+        return cls
+
+    def reduce(self, value):
+        if isinstance(value, CollectionStore):
+            return (COLLECTION, class_path(value.__class__),
+                    class_path(value.store_class), value._items())
+        if isinstance(value, Store):
+            return (STORE, class_path(value.__class__), value.data)
+        if isinstance(value, list) and any(isinstance(item, Store) for item in value):
+            return (LIST, [self.reduce(item) for item in value])
+        return (VALUE, value)
+
+    def rebuild(self, reduced):
+        tag = reduced[0]
+        if tag == COLLECTION:
+            return self.resolve(reduced[1])(self.resolve(reduced[2]), reduced[3])
+        if tag == STORE:
+            return self.resolve(reduced[1])(reduced[2])
+        if tag == LIST:
+            return [self.rebuild(item) for item in reduced[1]]
+        return reduced[1]
+
+    def serialize(self, reduced):
+        try:
+            if self.serializer == MSGPACK:
+                return MSGPACK, msgpack.packb(reduced, use_bin_type=True)
+            return MARSHAL, marshal.dumps(reduced)
+        except (ValueError, TypeError):
+            return PICKLE, cPickle.dumps(reduced, cPickle.HIGHEST_PROTOCOL)
+
+    def encode(self, value):
+        serializer, payload = self.serialize(self.reduce(value))
+        if len(payload) > self.compress_threshold:
+            return serializer + COMPRESSED + zlib.compress(payload, self.compress_level)
+        return serializer + RAW + payload
+
+    def decode(self, payload):
+        serializer, compression, payload = payload[0], payload[1], payload[2:]
+        if compression == COMPRESSED:
+            payload = zlib.decompress(payload)
+        if serializer == MSGPACK:
+            reduced = msgpack.unpackb(payload, raw=False)
+        elif serializer == MARSHAL:
+            reduced = marshal.loads(payload)
+        else:
+            reduced = cPickle.loads(payload)
+        return self.rebuild(reduced)
@@ -1,7 +1,16 @@
+from Queue import LifoQueue, Empty
 from collections import namedtuple
+from copy import deepcopy
 from functools import wraps, partial
 from warnings import warn
-from . import config
+from . import config, Store, CollectionStore
+from .signals import config_changed, rpc_call_started, rpc_call_finished
+from .utils import Future, FutureTimeout, Histogram, SingleFlight, ThreadPool
+import contextlib
+import json
+import sys
+import threading
+import time
 
 
 RpcSignature = namedtuple('RpcSignature', 'interface, method, data_converter, args')
@@ -12,9 +21,15 @@ def check_data(data_converter, data):
     For empty result (<> void), the data converter is still run because the backend
     omits empty and null attributes for bandwidth efficiency.
     In case of data being an array, a collection of items is assumed and each item
-    is converted using the provided `data_converter`.
+    is converted using the provided `data_converter`. For a `Store` data converter
+    setting `lazy_lists`, a `CollectionStore` wraps the items when they are accessed
+    instead, its list methods working on the item data rather than the stores.
     """
     if isinstance(data, list):
+        if (isinstance(data_converter, type) and issubclass(data_converter, Store)
+                and not issubclass(data_converter, CollectionStore)
+                and getattr(data_converter, 'lazy_lists', False)):
+            return CollectionStore(data_converter, data)
         return [data_converter(d) for d in data]
     if data is not None:
         return data_converter(data)
@@ -27,20 +42,429 @@ def rpc_call(func):
     @wraps(func)
     def inner(cls, *args, **kwargs):
         sig = func(cls, *args, **kwargs)
-        return do_rpc_call(sig)
+        if isinstance(sig, RpcSignature):
+            return do_rpc_call(sig)
+        return do_rpc_calls(sig)[-1]
     return inner
 
 
+class PoolTimeout(Exception):
+    """No client of the pool got free in time."""
+
+
+class ClientPool(object):
+    """Thread-safe pool of at most `size` Reaktor clients, created on demand
+    by `factory`, so that calls reuse warm connections. Clients idle for more
+    than `max_idle` seconds, or failing the `check` callable, are replaced.
+    Waiting for a free client raises `PoolTimeout` after `timeout` seconds.
+    """
+    def __init__(self, factory, size=8, timeout=10, max_idle=60, check=None):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check = check
+        # the most recently used client is reused first, free slots are `None`
+        self.idle = LifoQueue()
+        for i in range(size):
+            self.idle.put(None)
+
+    def acquire(self):
+        try:
+            item = self.idle.get(timeout=self.timeout)
+        except Empty:
+            raise PoolTimeout("No free client after %s seconds" % self.timeout)
+        if item is not None:
+            client, released = item
+            if time.time() - released <= self.max_idle and (
+                    self.check is None or self.check(client)):
+                return client
+            self.close(client)
+        try:
+            return self.factory()
+        except BaseException:
+            self.idle.put(None)
+            raise
+
+    def release(self, client):
+        self.idle.put((client, time.time()))
+
+    def discard(self, client):
+        """Drops a client, e.g. after an error left its connection unusable."""
+        self.close(client)
+        self.idle.put(None)
+
+    def close(self, client):
+        close = getattr(client, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def clear(self):
+        """Closes the idle clients."""
+        items = []
+        while True:
+            try:
+                items.append(self.idle.get_nowait())
+            except Empty:
+                break
+        for item in items:
+            if item is not None:
+                self.close(item[0])
+            self.idle.put(None)
+
+    @contextlib.contextmanager
+    def client(self):
+        """Lends a client, discarded if the block raises, interrupts included."""
+        client = self.acquire()
+        try:
+            yield client
+        except BaseException:
+            self.discard(client)
+            raise
+        self.release(client)
+
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_client_pool():
+    """Returns the pool of the configured Reaktor, or None without pooling.
+    The pool is created again once the configuration changes.
+    """
+    global pool
+    current = pool
+    if current is None:
+        with pool_lock:
+            if pool is None:
+                pool = ClientPool(config.REAKTOR, size=config.REAKTOR_POOL_SIZE,
+                                  timeout=config.REAKTOR_POOL_TIMEOUT,
+                                  max_idle=config.REAKTOR_POOL_MAX_IDLE,
+                                  check=getattr(config, 'REAKTOR_POOL_CHECK', None))
+            current = pool
+    if not current.size:
+        return None
+    return current
+
+
+@config_changed.connect
+def reset_client_pool(sender, **settings):
+    global pool
+    with pool_lock:
+        if pool is not None:
+            pool.clear()
+            pool = None
+
+
+timer = time.time
+
+
+def call_reaktor(sig, converter, record=None):
+    """Calls the RPC method of a signature with a client of the pool, if any.
+    With a `record` dict, the sizes of the request and response are recorded
+    if the client reports them, see `record_sizes`.
+    """
+    client_pool = get_client_pool()
+    if client_pool is None:
+        return call_client(config.REAKTOR(), sig, converter, record)
+    with client_pool.client() as reaktor:
+        return call_client(reaktor, sig, converter, record)
+
+
+def call_client(reaktor, sig, converter, record=None):
+    interface = getattr(reaktor, sig.interface)
+    result = getattr(interface, sig.method)(*sig.args, data_converter=converter)
+    if record is not None:
+        record_sizes(reaktor, record)
+    return result
+
+
+def record_sizes(reaktor, record):
+    """Records the `request_size` and `response_size` of the last call of a
+    client, in bytes, for the clients reporting them as attributes.
+    """
+    for name in ('request_size', 'response_size'):
+        # the attributes of Reaktor clients are their interfaces by default
+        size = getattr(reaktor, name, None)
+        if isinstance(size, (int, long)):
+            record[name] = size
+
+
+def raw_data(data):
+    return data
+
+
+# identical calls in flight, shared with `RPC_SINGLE_FLIGHT`
+flight = SingleFlight()
+async_flights = {}
+async_lock = threading.Lock()
+async_counters = {'coalesced': 0}
+
+
+def flight_key(sig):
+    return (sig.interface, sig.method, repr(sig.args))
+
+
+def call_reaktor_once(sig):
+    """Calls the Reaktor, sharing the request of the identical calls in flight.
+    Each of the coalesced callers gets its own copy of the raw data.
+    """
+    return flight.do(flight_key(sig), partial(call_reaktor, sig, raw_data), copy=deepcopy)
+
+
+def single_flight_stats():
+    """Returns the number of RPC calls made with `RPC_SINGLE_FLIGHT`, and of
+    the ones which shared the request of an identical call in flight.
+    """
+    with flight.lock:
+        stats = dict(flight.counters)
+    with async_lock:
+        stats['calls'] += async_counters['coalesced']
+        stats['coalesced'] += async_counters['coalesced']
+    return stats
+
+
 def do_rpc_call(sig):
-    interface = getattr(config.REAKTOR(), sig.interface)
-    converter = partial(check_data, sig.data_converter)
-    return getattr(interface, sig.method)(*sig.args, data_converter=converter)
+    """Calls the RPC method of a signature and returns its converted result.
+    With `RPC_SINGLE_FLIGHT`, concurrent identical calls share one request,
+    each caller converting its own copy of the raw data.
+    The call is measured only if the `rpc_call_*` signals have receivers.
+    """
+    if rpc_call_started.receivers or rpc_call_finished.receivers:
+        return do_measured_rpc_call(sig)
+    if config.RPC_SINGLE_FLIGHT:
+        return check_data(sig.data_converter, call_reaktor_once(sig))
+    return call_reaktor(sig, partial(check_data, sig.data_converter))
+
+
+def do_measured_rpc_call(sig):
+    """Same as `do_rpc_call`, sending the `rpc_call_started` and `rpc_call_finished`
+    signals. The request and response sizes are the ones reported by the client
+    (see `record_sizes`). Otherwise the request size is estimated from the JSON
+    encoding of the arguments, and the response size is left out. The
+    serialization is timed along with the network, within the Reaktor client.
+    Calls coalesced with `RPC_SINGLE_FLIGHT` report no size, as they send no
+    request of their own.
+    """
+    rpc_call_started.send(sig)
+    record = {'error': None}
+    start = timer()
+    try:
+        if config.RPC_SINGLE_FLIGHT:
+            data = call_reaktor_once(sig)
+        else:
+            data = call_reaktor(sig, raw_data, record)
+        record['network_time'] = timer() - start
+        if 'request_size' not in record and not config.RPC_SINGLE_FLIGHT:
+            record['request_size'] = len(json.dumps(sig.args, default=repr))
+        record['result_count'] = len(data) if isinstance(data, list) else int(data is not None)
+        conversion_start = timer()
+        result = check_data(sig.data_converter, data)
+        record['conversion_time'] = timer() - conversion_start
+        return result
+    except Exception, e:
+        record['error'] = e
+        raise
+    finally:
+        record['time'] = timer() - start
+        rpc_call_finished.send(sig, **record)
+
+
+def rpc_call_async(func):
+    """Same as `rpc_call`, returning the `Future` of the call instead of its
+    result, or the list of the futures of multiple rpc signatures.
+    """
+    @wraps(func)
+    def inner(cls, *args, **kwargs):
+        sig = func(cls, *args, **kwargs)
+        if isinstance(sig, RpcSignature):
+            return do_rpc_call_async(sig)
+        return [do_rpc_call_async(s) for s in sig]
+    return inner
+
+
+def do_rpc_call_async(sig):
+    """Starts the call of a signature on the RPC threads and returns its
+    `Future`, without blocking the caller. With `RPC_SINGLE_FLIGHT`, the
+    identical calls in flight share the same request, and the same thread.
+    """
+    # measured calls are coalesced by `do_rpc_call`, to be measured separately
+    if not config.RPC_SINGLE_FLIGHT or rpc_call_finished.receivers:
+        return get_executor().submit(do_rpc_call, sig)
+    key = flight_key(sig)
+    with async_lock:
+        flight_state = async_flights.get(key)
+        leader = flight_state is None
+        if leader:
+            flight_state = async_flights[key] = {
+                'raw': get_executor().submit(call_reaktor_once, sig), 'waiters': 0}
+        else:
+            flight_state['waiters'] += 1
+            async_counters['coalesced'] += 1
+    raw = flight_state['raw']
+    if leader:
+        raw.add_done_callback(partial(end_async_flight, key, flight_state))
+    future = Future()
+    raw.add_done_callback(
+        partial(convert_async_result, sig.data_converter, future, flight_state, leader))
+    return future
+
+
+def end_async_flight(key, flight_state, raw):
+    with async_lock:
+        if async_flights.get(key) is flight_state:
+            del async_flights[key]
+
+
+def convert_async_result(data_converter, future, flight_state, leader, raw):
+    if raw.error is not None:
+        future.set_exception(raw.error)
+        return
+    try:
+        # no caller can join once the flight ended, before the leader converts:
+        # the original data is left untouched for the others to copy it
+        data = raw.value
+        if not leader or flight_state['waiters']:
+            data = deepcopy(data)
+        result = check_data(data_converter, data)
+    except Exception:
+        future.set_exception(sys.exc_info())
+    else:
+        future.set_result(result)
+
+
+class RpcTimeout(Exception):
+    """The RPC call did not complete in time."""
+
+
+class RpcBatchError(Exception):
+    """Some calls of a batch failed. `results` and `errors` hold the outcome
+    of each call, in the order of the signatures, `None` for no error.
+    """
+    def __init__(self, results, errors):
+        failed = sum(1 for error in errors if error is not None)
+        super(RpcBatchError, self).__init__("%s of %s RPC calls failed" % (failed, len(errors)))
+        self.results = results
+        self.errors = errors
+
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Returns the thread pool running the concurrent RPC calls."""
+    global executor
+    if executor is None:
+        with executor_lock:
+            if executor is None:
+                executor = ThreadPool(workers=config.RPC_WORKERS)
+    return executor
+
+
+def do_rpc_calls(sigs, timeout=None, return_errors=False):
+    """Runs the calls of many signatures concurrently, on at most
+    `RPC_WORKERS` threads, and returns their results in order. Calls still
+    running `timeout` seconds after the batch started fail with `RpcTimeout`.
+    If a call fails, `RpcBatchError` is raised, unless `return_errors` is set,
+    in which case the exception is returned in place of the result.
+    """
+    if timeout is None:
+        timeout = config.RPC_TIMEOUT
+    deadline = time.time() + timeout
+    pool = get_executor()
+    futures = [pool.submit(do_rpc_call, sig) for sig in sigs]
+    results, errors = [], []
+    for future in futures:
+        try:
+            results.append(future.result(max(deadline - time.time(), 0)))
+            errors.append(None)
+        except FutureTimeout:
+            results.append(None)
+            errors.append(RpcTimeout("No result after %s seconds" % timeout))
+        except Exception, e:
+            results.append(None)
+            errors.append(e)
+    if return_errors:
+        return [result if error is None else error for result, error in zip(results, errors)]
+    if any(error is not None for error in errors):
+        raise RpcBatchError(results, errors)
+    return results
+
+
+class RpcStats(object):
+    """Aggregates the `rpc_call_finished` signals per `interface.method`:
+    call and error counters, total request and response sizes in bytes, and
+    histograms of the timings (`time`, `network_time`, `conversion_time`)
+    in seconds.
+    """
+    timings = ('time', 'network_time', 'conversion_time')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = {}
+
+    def connect(self):
+        rpc_call_finished.connect(self.record)
+        return self
+
+    def disconnect(self):
+        rpc_call_finished.disconnect(self.record)
+
+    def record(self, sig, error, **record):
+        name = '%s.%s' % (sig.interface, sig.method)
+        with self.lock:
+            method = self.methods.get(name)
+            if method is None:
+                method = self.methods[name] = {
+                    'calls': 0, 'errors': 0, 'request_size': 0, 'response_size': 0}
+                for timing in self.timings:
+                    method[timing] = Histogram()
+            method['calls'] += 1
+            if error is not None:
+                method['errors'] += 1
+            method['request_size'] += record.get('request_size', 0)
+            method['response_size'] += record.get('response_size', 0)
+            for timing in self.timings:
+                if timing in record:
+                    method[timing].add(record[timing])
+
+    def stats(self):
+        """Returns the counters and timing summaries, by method name."""
+        with self.lock:
+            stats = {}
+            for name, method in self.methods.iteritems():
+                stats[name] = dict(method)
+                for timing in self.timings:
+                    stats[name][timing] = method[timing].to_dict()
+            return stats
 
 
 class RpcMixin(object):
+    # wrap list results in a `CollectionStore` rather than a list of stores
+    lazy_lists = False
+
     @classmethod
     @rpc_call
     def signature(cls, interface=None, method=None, data_converter=None, args=None, deprecated=False):
+        """Calls the RPC method described by `make_signature`, and returns its result."""
+        return cls.make_signature(interface, method, data_converter, args, deprecated)
+
+    @classmethod
+    @rpc_call_async
+    def signature_async(cls, interface=None, method=None, data_converter=None, args=None,
+                        deprecated=False):
+        """Starts the call of the RPC method described by `make_signature`, and
+        returns the `Future` of its result.
+        """
+        return cls.make_signature(interface, method, data_converter, args, deprecated)
+
+    @classmethod
+    def make_signature(cls, interface=None, method=None, data_converter=None, args=None,
+                       deprecated=False):
         """Returns a named tuple suitable for easy RPC call while providing
         some defaults: the RPC interface and the data converter are read
         from the class.
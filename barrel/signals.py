@@ -2,3 +2,14 @@ from blinker import signal
 
 
 class_ready = signal('class-ready')
+# sent by `Config.configure` with the new settings
+config_changed = signal('config-changed')
+# sent by `Cacher` with the key, outcome and timings of a call, only if connected
+cache_call = signal('cache-call')
+# sent by `Cacher.many` with the outcome counts and timings of a batch, only if connected
+cache_many = signal('cache-many')
+# sent by `barrel.rpc.do_rpc_call` with the signature before a call, only if connected
+rpc_call_started = signal('rpc-call-started')
+# sent by `barrel.rpc.do_rpc_call` with the signature, sizes, timings and error of a
+# call, only if connected
+rpc_call_finished = signal('rpc-call-finished')
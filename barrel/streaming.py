@@ -0,0 +1,40 @@
+"""Incremental decoding of JSON documents, so that big arrays can be
+wrapped item by item without holding the whole document in memory.
+Requires `ijson`.
+"""
+from decimal import Decimal
+from ijson import parse
+from ijson.common import ObjectBuilder
+
+
+def ijson_prefix(path, sep=':'):
+    """Translates a barrel key path leading to an array into the `ijson`
+    prefix of the array items. An empty path is the top level array.
+    """
+    keys = path.split(sep) if path else []
+    return '.'.join(keys + ['item'])
+
+
+def iter_items(fileobj, path=None, sep=':'):
+    """Yields the items of the array found at the given key path of the
+    JSON document read from `fileobj`, one at a time. Numbers are decoded
+    as `float`, like `json.loads` does, rather than `Decimal`.
+    """
+    prefix = ijson_prefix(path, sep)
+    events = parse(fileobj)
+    for current, event, value in events:
+        if current != prefix:
+            continue
+        if event in ('start_map', 'start_array'):
+            builder = ObjectBuilder()
+            end_event = event.replace('start', 'end')
+            while (current, event) != (prefix, end_event):
+                if event == 'number' and isinstance(value, Decimal):
+                    value = float(value)
+                builder.event(event, value)
+                current, event, value = next(events)
+            yield builder.value
+        elif event == 'number' and isinstance(value, Decimal):
+            yield float(value)
+        elif event not in ('end_map', 'end_array'):
+            yield value
@@ -0,0 +1,353 @@
+"""A local stand-in for the Reaktor, to test and benchmark RPC calls without
+the real backend: a small threaded JSON-RPC server over HTTP/1.1, a client
+keeping its connection alive across calls, a recorder of the responses of
+the real Reaktor to replay them, and a load test driver.
+
+Usage::
+
+    server = StandInServer({'WSUser.getUser': lambda id: {'userID': id}}).start()
+    config.configure(REAKTOR=server.client_factory())
+    ...
+    server.stop()
+
+Or, to load test the RPC calls of barrel::
+
+    python -m barrel.testing --concurrency 20 --latency 0.01
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from functools import partial
+from . import config, Store, IntField
+from .rpc import RpcMixin, get_client_pool
+import argparse
+import httplib
+import itertools
+import json
+import random
+import socket
+import threading
+import time
+
+
+class StandInError(Exception):
+    """Error returned by the stand-in server."""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send responses at once, Nagle's algorithm delaying them on kept alive connections
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count('connections')
+        with self.server.lock:
+            self.server.open_connections.add(self.connection)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.open_connections.discard(self.connection)
+        BaseHTTPRequestHandler.finish(self)
+
+    def do_POST(self):
+        self.server.count('requests')
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        response = {'id': request.get('id'), 'result': None, 'error': None}
+        try:
+            response['result'] = self.server.dispatch(
+                request['method'], request.get('params', []))
+        except StandInError, e:
+            response['error'] = {'message': str(e)}
+        except Exception, e:
+            response['error'] = {'message': '%s: %s' % (e.__class__.__name__, e)}
+        body = json.dumps(response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def response_key(name, params):
+    return '%s %s' % (name, json.dumps(list(params), sort_keys=True))
+
+
+def load_responses(path):
+    """Loads the responses saved by `Recorder.save`."""
+    with open(path) as f:
+        return json.load(f)
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """JSON-RPC server calling `methods`, a dict of the functions to call by
+    `interface.method` name. It listens on a free local port by default.
+
+    `responses` are canned results, replayed instead of calling the methods,
+    as recorded by `Recorder`. Responses are delayed by `latency` seconds, or
+    by the result of `latency(name)` if callable, and a share `error_rate` of
+    the calls fail. `seed` makes the failing calls reproducible.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    # load tests open many connections at once
+    request_queue_size = 128
+
+    def __init__(self, methods=None, host='127.0.0.1', port=0, responses=None, latency=0,
+                 error_rate=0, seed=None):
+        HTTPServer.__init__(self, (host, port), StandInHandler)
+        self.methods = methods or {}
+        self.responses = responses or {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {'connections': 0, 'requests': 0}
+        self.open_connections = set()
+        self.thread = None
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def dispatch(self, name, params):
+        """Returns the result of a call, or raises `StandInError`."""
+        latency = self.latency(name) if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise StandInError("Injected error: %s" % name)
+        key = response_key(name, params)
+        if key in self.responses:
+            return self.responses[key]
+        method = self.methods.get(name)
+        if method is None:
+            raise StandInError("Unknown method: %s" % name)
+        return method(*params)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+        # unblocks the handlers of the kept alive connections
+        with self.lock:
+            for connection in self.open_connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client_factory(self, timeout=10):
+        """Returns a callable creating clients of the server, suitable for the
+        `REAKTOR` setting.
+        """
+        host, port = self.server_address
+        return partial(StandInClient, host, port, timeout)
+
+
+class StandInInterface(object):
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return partial(self.client.call, self.name, method)
+
+
+class StandInClient(object):
+    """Client of a `StandInServer`, exposing the Reaktor interfaces as
+    attributes: `client.WSUser.getUser(42, data_converter=User)`.
+    """
+    def __init__(self, host, port, timeout=10):
+        self.connection = httplib.HTTPConnection(host, port, timeout=timeout)
+        self.last_id = 0
+        # sizes of the last request and response bodies, see `barrel.rpc.record_sizes`
+        self.request_size = None
+        self.response_size = None
+
+    def __getattr__(self, interface):
+        if interface.startswith('_'):
+            raise AttributeError(interface)
+        return StandInInterface(self, interface)
+
+    def call(self, interface, method, *args, **kwargs):
+        data_converter = kwargs.get('data_converter')
+        self.last_id += 1
+        body = json.dumps({
+            'id': self.last_id, 'method': '%s.%s' % (interface, method), 'params': args})
+        self.connection.request('POST', '/rpc', body, {'Content-Type': 'application/json'})
+        raw = self.connection.getresponse().read()
+        self.request_size, self.response_size = len(body), len(raw)
+        response = json.loads(raw)
+        if response['error'] is not None:
+            raise StandInError(response['error']['message'])
+        if data_converter is None:
+            return response['result']
+        return data_converter(response['result'])
+
+    def close(self):
+        self.connection.close()
+
+
+class RecordingClient(object):
+    """Client recording the raw data of the calls of `client`."""
+    def __init__(self, recorder, client):
+        self.recorder = recorder
+        self.client = client
+
+    @property
+    def request_size(self):
+        return getattr(self.client, 'request_size', None)
+
+    @property
+    def response_size(self):
+        return getattr(self.client, 'response_size', None)
+
+    def __getattr__(self, interface):
+        if interface.startswith('_'):
+            raise AttributeError(interface)
+        return StandInInterface(self, interface)
+
+    def call(self, interface, method, *args, **kwargs):
+        data_converter = kwargs.pop('data_converter', None)
+        name = '%s.%s' % (interface, method)
+
+        def record(data):
+            self.recorder.record(name, args, data)
+            return data if data_converter is None else data_converter(data)
+        method = getattr(getattr(self.client, interface), method)
+        return method(*args, data_converter=record, **kwargs)
+
+    def close(self):
+        close = getattr(self.client, 'close', None)
+        if close is not None:
+            close()
+
+
+class Recorder(object):
+    """Client factory recording the responses of the clients of `factory`,
+    to be replayed by a `StandInServer`::
+
+        recorder = Recorder(config.REAKTOR)
+        config.configure(REAKTOR=recorder)
+        ...
+        recorder.save('responses.json')
+        server = StandInServer(responses=load_responses('responses.json'))
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.responses = {}
+
+    def __call__(self):
+        return RecordingClient(self, self.factory())
+
+    def record(self, name, params, data):
+        with self.lock:
+            self.responses[response_key(name, params)] = data
+
+    def save(self, path):
+        with self.lock:
+            with open(path, 'w') as f:
+                json.dump(self.responses, f, indent=2, sort_keys=True)
+
+
+def percentile(ordered, percent):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * percent / 100.0), len(ordered) - 1)]
+
+
+def load_test(fn, requests=1000, concurrency=10):
+    """Calls `fn` `requests` times from `concurrency` threads. Returns the
+    throughput in calls per second, the latencies in seconds and the number
+    of calls which raised.
+    """
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def work():
+        while True:
+            with lock:
+                if next(counter) >= requests:
+                    return
+            start = time.time()
+            try:
+                fn()
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            finally:
+                latencies.append(time.time() - start)
+
+    threads = [threading.Thread(target=work) for i in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors[0],
+        'duration': duration,
+        'throughput': requests / duration,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else 0.0,
+    }
+
+
+class LoadTestUser(Store, RpcMixin):
+    interface = 'WSUser'
+    id = IntField(target='userID')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test the RPC calls of barrel against a local stand-in server.")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0, help="server latency, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--pool-size', type=int, default=config.REAKTOR_POOL_SIZE,
+                        help="size of the client pool, 0 to disable it")
+    args = parser.parse_args()
+    server = StandInServer({'WSUser.getUser': lambda id: {'userID': id}},
+                           latency=args.latency, error_rate=args.error_rate).start()
+    config.configure(REAKTOR=server.client_factory(), REAKTOR_POOL_SIZE=args.pool_size)
+    try:
+        results = load_test(lambda: LoadTestUser.signature(method='getUser', args=[42]),
+                             args.requests, args.concurrency)
+    finally:
+        if get_client_pool() is not None:
+            get_client_pool().clear()
+        server.stop()
+    print('%(requests)d requests, %(errors)d errors in %(duration).2f s' % results)
+    print('throughput: %.1f requests/s' % results['throughput'])
+    print('latency: p50 %.2f ms, p99 %.2f ms, max %.2f ms' % tuple(
+        results[name] * 1000 for name in ('p50', 'p99', 'max')))
+
+
+if __name__ == '__main__':
+    main()
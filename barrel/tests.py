@@ -1,10 +1,35 @@
 from . import *
 from . import simple_get, simple_set, deep_get, deep_set  # those are not publicly exposed
+from . import raw_values, collection_views, _skip
+from . import keys
+from .cache import (caching, cache_clearing, LocalLock, LeaseLock, MemoryEngine, LayeredEngine,
+                    Refresher, CacheStats)
+from .codec import StoreCodec, msgpack
+from .rpc import (check_data, RpcMixin, RpcSignature, ClientPool, PoolTimeout, RpcTimeout,
+                  RpcBatchError, rpc_call, do_rpc_calls, do_rpc_call_async, get_client_pool,
+                  reset_client_pool, single_flight_stats, RpcStats)
+from .signals import rpc_call_started, rpc_call_finished
+from .testing import StandInServer, StandInError, Recorder, load_responses, load_test
+from .utils import ThreadPool, Histogram
 from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal
 from unittest import TestCase
-from unittest import skip
+from unittest import skip, skipIf
+from io import BytesIO
+from threading import Event, Thread
+from time import sleep, time
+import json
+import os
+import tempfile
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 
 DATA = {
@@ -62,6 +87,43 @@ class LazyBar(Store):
     foo = EmbeddedStoreField(target='foo', store_class='LazyFoo')
 
 
+# module level classes, for the features that need to import the store class
+class ExternalUid(Store):
+    service = Field(target='authenticationServiceName')
+
+
+class Account(Store):
+    id = IntField(target='userID')
+    external_uid = EmbeddedStoreField(target='externalUserIdentifiers',
+                                      store_class=ExternalUid, is_array=True)
+
+
+class CompactAccount(Account):
+    compact = True
+
+
+class RemoteAccount(Account, RpcMixin):
+    interface = 'WSUser'
+
+    @classmethod
+    def get_by_id(cls, id):
+        return cls.signature(method='getUser', args=[id])
+
+    @classmethod
+    @rpc_call
+    def touch_and_get(cls, id):
+        return [RpcSignature(cls.interface, 'touch', None, [id]),
+                RpcSignature(cls.interface, 'getUser', cls, [id])]
+
+    @classmethod
+    def user_signature(cls, id, method='getUser'):
+        return RpcSignature(cls.interface, method, cls, [id])
+
+
+class LazyRemoteAccount(RemoteAccount):
+    lazy_lists = True
+
+
 class BarrelTestCase(TestCase):
     """The test case for Barrel."""
 
@@ -97,6 +159,26 @@ class BarrelTestCase(TestCase):
             deep_get("settings/com.bookpac.user.settings.locale", self.raw_data, sep='/'),
             self.raw_data["settings"]["com.bookpac.user.settings.locale"])
 
+    def testFieldCompiledTarget(self):
+        """`Field` splits its target once, at definition time"""
+        f = Field(target='settings:com.bookpac.user.settings.locale')
+        self.assertEqual(f.keys, ('settings', 'com.bookpac.user.settings.locale'))
+        self.assertEqual(
+            f.get(self.raw_data),
+            self.raw_data["settings"]["com.bookpac.user.settings.locale"])
+
+    def testFieldCompiledSetter(self):
+        """`Field` setter creates the missing levels of a deep target"""
+        local_data = {}
+        f = Field(target='foo/bar/baz', target_sep='/')
+        f.set(local_data, 'oui')
+        self.assertEqual(local_data, {'foo': {'bar': {'baz': 'oui'}}})
+
+    def testTypedFieldDeepTarget(self):
+        """Typed fields convert values fetched through deep targets"""
+        f = FloatField(target='money:amount')
+        self.assertEqual(f.get(self.raw_data), 0.99)
+
     def testFieldNoTarget(self):
         """`Field` cannot be instantiated without target"""
         self.assertRaises(TypeError, Field)
@@ -152,6 +234,36 @@ class BarrelTestCase(TestCase):
         # check that __getattribute__ doesn't mess with the normal attributes
         self.assertEqual(User().id, 'some')
 
+    def testStoreClassField(self):
+        """`Field`-type attributes are returned as is on the class"""
+        class User(Store):
+            id = Field(target='userID')
+
+        self.assertTrue(isinstance(User.id, Field))
+        self.assertEqual(User.id.name, 'id')
+
+    def testStoreFieldOverride(self):
+        """Fields redefined in a subclass take precedence over the parents' ones"""
+        class User(Store):
+            id = Field(target='userID')
+
+        class FacebookUser(User):
+            id = Field(target='userName')
+
+        u = FacebookUser(deepcopy(self.raw_data))
+        self.assertEqual(u.id, self.raw_data['userName'])
+        self.assertTrue(FacebookUser.fields['id'] is FacebookUser.id)
+        u.id = 'eureka!'
+        self.assertEqual(u.data['userName'], 'eureka!')
+
+    def testStoreEmbeddedStoreFieldSet(self):
+        """Embedded stores cannot be assigned"""
+        class User(Store):
+            settings = EmbeddedStoreField(target='settings', store_class=Store)
+
+        u = User(self.raw_data)
+        self.assertRaises(TypeError, setattr, u, 'settings', {})
+
     def testEmbeddedStoreField(self):
         """`EmbeddedStoreField` has the `store` attribute of the given class"""
         class Foo(Store):
@@ -174,6 +286,25 @@ class BarrelTestCase(TestCase):
             u.settings.locale,
             self.raw_data["settings"]["com.bookpac.user.settings.locale"])
 
+    def testStoreMixinFields(self):
+        """`Store` binds the fields of plain mixin bases to their names"""
+        class Value(Store):
+            v = Field(target='v')
+
+        class Mixin(object):
+            a = EmbeddedStoreField(target='a', store_class=Value)
+            b = EmbeddedStoreField(target='b', store_class=Value)
+            c = Field(target='c')
+            d = Field(target='d')
+
+        class Mixed(Store, Mixin):
+            cache_values = True
+
+        m = Mixed({'a': {'v': 1}, 'b': {'v': 2}, 'c': 3, 'd': 4})
+        self.assertEqual((m.a.v, m.b.v), (1, 2))
+        self.assertEqual((m.c, m.d), (3, 4))
+        self.assertEqual(sorted(Mixed.fields), ['a', 'b', 'c', 'd'])
+
     def testStoreWithEmbeddedStoreFieldSet(self):
         """`Store` sets data in the embedded store"""
         local_data = deepcopy(self.raw_data)
@@ -224,6 +355,280 @@ class BarrelTestCase(TestCase):
         u.money.amount
         self.assertEqual(len(u._embedded_stores_cache), 1)
 
+    def testStoreValuesCache(self):
+        """`Store` memoizes converted values when `cache_values` is set"""
+        class User(Store):
+            cache_values = True
+            password_expiration = DateField(target='passwordExpiration')
+
+        class UncachedUser(User):
+            cache_values = False
+
+        u = User(self.raw_data)
+        self.assertTrue(u.password_expiration is u.password_expiration)
+        u = UncachedUser(self.raw_data)
+        self.assertFalse(u.password_expiration is u.password_expiration)
+
+    def testStoreValuesCacheWrite(self):
+        """Writing a field drops the memoized values"""
+        class User(Store):
+            cache_values = True
+            id = IntField(target='userID')
+            settings = Field(target='settings')
+            locale = Field(target='settings:com.bookpac.user.settings.locale')
+
+        u = User(deepcopy(self.raw_data))
+        self.assertEqual(u.id, self.raw_data['userID'])
+        self.assertEqual(u.locale, 'de')
+        u.id = '42'
+        self.assertEqual(u.id, 42)
+        # overlapping targets are dropped as well
+        u.settings = {'com.bookpac.user.settings.locale': 'fr'}
+        self.assertEqual(u.locale, 'fr')
+
+    def testStoreInvalidate(self):
+        """`Store.invalidate` drops the memoized values after external changes"""
+        class User(Store):
+            cache_values = True
+            id = IntField(target='userID')
+
+        u = User(deepcopy(self.raw_data))
+        u.id
+        u.data['userID'] = '42'
+        self.assertEqual(u.id, self.raw_data['userID'])
+        u.invalidate('id')
+        self.assertEqual(u.id, 42)
+        u.data['userID'] = '43'
+        u.invalidate()
+        self.assertEqual(u.id, 43)
+
+    def testStoreToDict(self):
+        """`Store.to_dict` returns the converted values of all the fields"""
+        class UserSettings(Store):
+            locale = Field(target='com.bookpac.user.settings.locale')
+
+        class User(Store):
+            id = IntField(target='userID')
+            country = Field(target='settings:com.bookpac.user.settings.shop.country')
+            zipcode = IntField(target='settings:com.bookpac.user.settings.shop.zipcode')
+            nowhere = Field(target='settings:nowhere')
+            settings = EmbeddedStoreField(target='settings', store_class=UserSettings)
+
+        u = User(self.raw_data)
+        self.assertEqual(u.to_dict(), {
+            'id': 32217171,
+            'country': 'DE',
+            'zipcode': 12345,
+            'settings': {'locale': 'de'},
+        })
+        self.assertEqual(
+            u.to_dict(['id', 'nowhere'], missing=None), {'id': 32217171, 'nowhere': None})
+        self.assertRaises(AttributeError, u.to_dict, ['foo'])
+
+    def testStoreToDictDefault(self):
+        """`Store.to_dict` uses the field defaults for missing values"""
+        class User(Store):
+            tags = SplitField(target='__nowhere:tags', default=[])
+
+        self.assertEqual(User(self.raw_data).to_dict(), {'tags': []})
+
+    def testStoreToDictIterator(self):
+        """`Store.to_dict` reads field names given as an iterator once"""
+        class User(Store):
+            id = IntField(target='userID')
+            country = Field(target='settings:com.bookpac.user.settings.shop.country')
+
+        u = User(self.raw_data)
+        self.assertEqual(u.to_dict(name for name in ['country']), {'country': 'DE'})
+        self.assertEqual(u.to_dict(['country']), {'country': 'DE'})
+
+    def testStoreToDictOverriddenGet(self):
+        """`Store.to_dict` supports fields overriding `get`"""
+        class UpperField(Field):
+            def get(self, dct):
+                return super(UpperField, self).get(dct).upper()
+
+        class User(Store):
+            company = UpperField(target='company')
+
+        self.assertEqual(User(self.raw_data).to_dict(), {'company': 'TXTR'})
+
+    def testCollectionStoreToList(self):
+        """`CollectionStore.to_list` returns the values of every item"""
+        class UserExternalUid(Store):
+            service = Field(target='authenticationServiceName')
+            uid = LongIntField(target='identifier')
+
+        a = CollectionStore(UserExternalUid, self.raw_data['externalUserIdentifiers'])
+        self.assertEqual(a.to_list(), [{'service': 'FACEBOOK', 'uid': 100003691408573L}])
+        self.assertEqual(a.to_list(['uid']), [{'uid': 100003691408573L}])
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def testCollectionStoreColumn(self):
+        """`CollectionStore.column` returns a NumPy array of the field values"""
+        class Price(Store):
+            amount = FloatField(target='amount')
+            quantity = IntField(target='quantity', default=1)
+
+        a = CollectionStore(Price, [{'amount': '0.99', 'quantity': 2}, {'amount': 1.5}])
+        amounts = a.column('amount')
+        self.assertTrue(isinstance(amounts, numpy.ndarray))
+        self.assertFalse(isinstance(amounts, numpy.ma.MaskedArray))
+        self.assertEqual(amounts.tolist(), [0.99, 1.5])
+        self.assertEqual(a.column('amount', dtype='float32').dtype, numpy.float32)
+        # missing values are masked, even if the field has a default
+        quantities = a.column('quantity')
+        self.assertTrue(isinstance(quantities, numpy.ma.MaskedArray))
+        self.assertEqual(quantities.mask.tolist(), [False, True])
+        self.assertEqual(quantities.sum(), 2)
+
+    def testRawValuesMissing(self):
+        """`raw_values` marks the missing values, whether the field overrides `get` or not"""
+        class DefaultGetField(IntField):
+            def get(self, dct):
+                try:
+                    return self.convert(simple_get(self.target, dct))
+                except KeyError:
+                    return self.default
+
+        items = [{'quantity': '2'}, {}]
+        self.assertEqual(raw_values(IntField(target='quantity', default=1), items), ['2', _skip])
+        self.assertEqual(
+            raw_values(DefaultGetField(target='quantity', default=1), items), [2, _skip])
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def testCollectionStoreColumns(self):
+        """`CollectionStore.columns` extracts multiple fields at once"""
+        class Price(Store):
+            amount = FloatField(target='money:amount')
+            currency = Field(target='money:currency')
+
+        a = CollectionStore(Price, [self.raw_data, {}])
+        columns = a.columns(['amount', 'currency'])
+        self.assertEqual(sorted(columns), ['amount', 'currency'])
+        self.assertEqual(columns['amount'].compressed().tolist(), [0.99])
+        self.assertRaises(AttributeError, a.column, 'foo')
+
+        class DefaultPrice(Store):
+            amount = FloatField(target='money:amount', default='0')
+            active = BooleanField(target='active', default='false')
+
+        a = CollectionStore(DefaultPrice, [self.raw_data, {'active': 'true'}])
+        columns = a.columns(['amount', 'active'])
+        self.assertEqual(columns['amount'].sum(), 0.99)
+        self.assertEqual(columns['active'].tolist(), [None, True])
+
+    @skipIf(ijson is None, 'ijson is not installed')
+    def testCollectionStoreIterFromStream(self):
+        """`CollectionStore.iter_from_stream` yields stores for each array item"""
+        payload = BytesIO(json.dumps({'result': {'users': [self.raw_data] * 3}}))
+        users = CollectionStore.iter_from_stream(Account, payload, path='result:users')
+        users = list(users)
+        self.assertEqual(len(users), 3)
+        self.assertEqual(users[0].data, self.raw_data)
+        self.assertTrue(isinstance(users[0].data['money']['amount'], float))
+        self.assertEqual(users[0].external_uid[0].service, 'FACEBOOK')
+
+    @skipIf(ijson is None, 'ijson is not installed')
+    def testCollectionStoreIterFromStreamTopLevel(self):
+        """`CollectionStore.iter_from_stream` reads top level arrays by default"""
+        payload = BytesIO(json.dumps([{'id': 1}, {'id': 2}]))
+        ids = [s.data['id'] for s in CollectionStore.iter_from_stream(Store, payload)]
+        self.assertEqual(ids, [1, 2])
+
+    @skipIf(ijson is None, 'ijson is not installed')
+    def testCollectionStoreIterFromStreamPrune(self):
+        """`CollectionStore.iter_from_stream` prunes the items on demand"""
+        payload = BytesIO(json.dumps([self.raw_data]))
+        users = list(CollectionStore.iter_from_stream(Account, payload, prune=True))
+        self.assertEqual(sorted(users[0].data), ['externalUserIdentifiers', 'userID'])
+
+    def testStoreKeyTree(self):
+        """`Store.key_tree` compiles the key paths read by the fields"""
+        class UserSettings(Store):
+            locale = Field(target='com.bookpac.user.settings.locale')
+
+        class User(Store):
+            id = IntField(target='userID')
+            country = Field(target='settings:com.bookpac.user.settings.shop.country')
+            settings = EmbeddedStoreField(target='settings', store_class=UserSettings)
+            external_uid = EmbeddedStoreField(target='externalUserIdentifiers',
+                                              store_class=ExternalUid, is_array=True)
+            money = Field(target='money')
+
+        self.assertEqual(User.key_tree(), {
+            'userID': None,
+            'settings': {
+                'com.bookpac.user.settings.shop.country': None,
+                'com.bookpac.user.settings.locale': None,
+            },
+            'externalUserIdentifiers': {'authenticationServiceName': None},
+            'money': None,
+        })
+        self.assertEqual(LazyFoo.key_tree(), {'id': None, 'bar': {'foo': None}})
+
+    def testStorePrune(self):
+        """`Store.prune` drops the keys no field reads"""
+        u = Account.loads(json.dumps(self.raw_data))
+        self.assertEqual(u.data, {
+            'userID': self.raw_data['userID'],
+            'externalUserIdentifiers': [{'authenticationServiceName': 'FACEBOOK'}],
+        })
+        self.assertEqual(u.id, self.raw_data['userID'])
+        self.assertEqual(u.external_uid[0].service, 'FACEBOOK')
+
+    def testStorePruneDictCollection(self):
+        """`Store.prune` prunes the values of dict-shaped collections"""
+        class Document(Store):
+            categories = EmbeddedStoreField(target='categories', store_class=ExternalUid,
+                                            is_array=True)
+
+        data = {'categories': {
+            'a': {'authenticationServiceName': 'x', 'foo': 1},
+            'b': {'authenticationServiceName': 'y'},
+        }, 'bar': 2}
+        d = Document.loads(json.dumps(data))
+        self.assertEqual(d.data, {'categories': {
+            'a': {'authenticationServiceName': 'x'},
+            'b': {'authenticationServiceName': 'y'},
+        }})
+        self.assertEqual(sorted(c.service for c in d.categories), ['x', 'y'])
+
+    def testCompactStore(self):
+        """Compact `Store` keeps its data in slots, without instance dict"""
+        import gc
+        u = CompactAccount(self.raw_data)
+        self.assertEqual(u.id, self.raw_data['userID'])
+        self.assertEqual(u.external_uid[0].service, 'FACEBOOK')
+        dicts = [r for r in gc.get_referents(u) if type(r) is dict]
+        self.assertEqual(
+            sorted(map(id, dicts)), sorted([id(u.data), id(u._embedded_stores_cache)]))
+        self.assertEqual(CompactAccount(self.raw_data)._embedded_stores_cache, None)
+
+    def testCompactStoreAttributes(self):
+        """Compact `Store` accepts fields and other attributes at init time"""
+        u = CompactAccount(id=42, foo='bar')
+        self.assertEqual(u.data, {'userID': 42})
+        self.assertEqual(u.foo, 'bar')
+
+    def testCompactStorePickle(self):
+        """Compact `Store` can be pickled"""
+        import pickle
+        u = CompactAccount(deepcopy(self.raw_data), foo='bar')
+        u.external_uid
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            v = pickle.loads(pickle.dumps(u, protocol))
+            self.assertEqual(v.data, u.data)
+            self.assertEqual(v.foo, 'bar')
+            self.assertEqual(v._embedded_stores_cache, None)
+
+    def testCompactCollectionStore(self):
+        """Collection stores cannot be compact"""
+        def define():
+            class Foo(CollectionStore):
+                compact = True
+        self.assertRaises(TypeError, define)
+
     def testEmbeddedStoreFieldLazyReference(self):
         """`EmbeddedStoreField` supports recursive references to other stores"""
         data = {'id': 'foo', 'bar': {'foo': {'id': 'some'}}}
@@ -253,6 +658,112 @@ class BarrelTestCase(TestCase):
         except TypeError as e:
             self.fail("Iterating over array `Store` raised TypeError: %s" % e)
 
+    def testCollectionStoreItemCache(self):
+        """Array `Store` item stores stay attached to their data when reordered"""
+        a = CollectionStore(Store, [{'id': 1}, {'id': 2}, {'id': 3}])
+        first, last = a[0], a[2]
+        self.assertTrue(a[0] is first)
+        a.reverse()
+        self.assertTrue(a[0] is last)
+        a.insert(0, {'id': 0})
+        self.assertEqual([s.data['id'] for s in a], [0, 3, 2, 1])
+        self.assertTrue(a[1] is last)
+        a.sort(key=lambda data: data['id'])
+        self.assertTrue(a[1] is first)
+        self.assertEqual(a.pop(1), {'id': 1})
+        self.assertEqual(len(a._embedded_stores_cache), 3)
+        self.assertEqual(a[1].data, {'id': 2})
+
+    def testCollectionStoreCachePolicy(self):
+        """Array `Store` item stores caching can be bounded or disabled"""
+        data = [{'id': i} for i in range(10)]
+        a = CollectionStore(Store, data, cache_policy='none')
+        self.assertFalse(a[0] is a[0])
+        a = CollectionStore(Store, data, cache_policy=3)
+        for s in a:
+            pass
+        self.assertEqual(len(a._embedded_stores_cache), 3)
+        self.assertTrue(a[9] is a[9])
+        a = CollectionStore(Store, data, cache_policy='weak')
+        for s in a:
+            pass
+        del s
+        self.assertEqual(len(a._embedded_stores_cache), 0)
+        self.assertRaises(ValueError, CollectionStore, Store, data, cache_policy='foo')
+
+    def testCollectionStoreExtendedSlice(self):
+        """Array `Store` supports extended slices"""
+        a = CollectionStore(Store, [{'id': i} for i in range(4)])
+        self.assertEqual([s.data['id'] for s in a[::2]], [0, 2])
+
+    def testCollectionStoreSliceView(self):
+        """Array `Store` slices share the data and the item stores"""
+        data = [{'id': i} for i in range(5)]
+        a = CollectionStore(Store, data)
+        first = a[1]
+        b = a[1:4]
+        self.assertEqual(len(b), 3)
+        self.assertTrue(b[0] is first)
+        self.assertTrue(b[-1].data is data[3])
+        self.assertRaises(IndexError, lambda: b[3])
+        self.assertEqual([s.data['id'] for s in b[1:]], [2, 3])
+        self.assertEqual([s.data['id'] for s in a[-2:]], [3, 4])
+        self.assertEqual(b, data[1:4])
+        self.assertEqual(len(a[4:2]), 0)
+
+    def testCollectionStoreSliceViewCopyOnWrite(self):
+        """Array `Store` slices and their parent do not see each other's changes"""
+        a = CollectionStore(Store, [{'id': i} for i in range(5)])
+        b = a[1:3]
+        b.append({'id': 'b'})
+        self.assertEqual(len(a), 5)
+        self.assertEqual([s.data['id'] for s in b], [1, 2, 'b'])
+        c = a[1:3]
+        a.insert(0, {'id': 'a'})
+        del a[1:3]
+        self.assertEqual([s.data['id'] for s in c], [1, 2])
+        self.assertEqual([s.data['id'] for s in a], ['a', 2, 3, 4])
+
+    def testCollectionStoreSliceViewSharedData(self):
+        """Array `Store` slices do not see the changes made by other collections of the same data"""
+        class Item(Store):
+            id = Field(target='id')
+
+        class Page(Store):
+            items = EmbeddedStoreField(target='items', store_class=Item, is_array=True)
+
+        data = {'items': [{'id': i} for i in range(3)]}
+        page = Page(data).items[0:2]
+        Page(data).items.insert(0, {'id': 'new'})
+        self.assertEqual([item.id for item in page], [0, 1])
+        self.assertEqual([item.id for item in Page(data).items], ['new', 0, 1, 2])
+        del page
+        self.assertFalse(id(data['items']) in collection_views)
+
+    def testCollectionStoreConcatenationView(self):
+        """Array `Store` concatenations are views of their operands"""
+        a = CollectionStore(Store, [{'id': 1}, {'id': 2}])
+        b = CollectionStore(Store, [{'id': 3}])
+        c = a + b + [{'id': 4}]
+        self.assertEqual([s.data['id'] for s in c], [1, 2, 3, 4])
+        self.assertTrue(c[2] is b[0])
+        self.assertEqual([s.data['id'] for s in [{'id': 0}] + a], [0, 1, 2])
+        self.assertEqual([s.data['id'] for s in a * 2], [1, 2, 1, 2])
+        self.assertEqual([s.data['id'] for s in c[1:3]], [2, 3])
+        b[0] = {'id': 'b'}
+        self.assertEqual(c[2].data, {'id': 3})
+
+    def testCollectionStorePickle(self):
+        """Array `Store` views and caches do not prevent pickling"""
+        import pickle
+        a = CollectionStore(Store, [{'id': 1}, {'id': 2}], cache_policy='weak')
+        b = a[1:]
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            c = pickle.loads(pickle.dumps(b, protocol))
+            self.assertEqual(c, [{'id': 2}])
+            self.assertEqual(c[0].data, {'id': 2})
+            self.assertEqual(pickle.loads(pickle.dumps(a, protocol)), a)
+
     def testEmbeddedCollectionStoreFieldData(self):
         """Nested `EmbeddedStoreField` are instantiated with correct data"""
         class Bar(Store):
@@ -372,3 +883,690 @@ class BarrelTestCase(TestCase):
         u = User(self.raw_data)
         self.assertEqual(
             u.money.currency.code, self.raw_data['money']['currency'])
+
+
+class DictEngine(object):
+    """Cache engine storing the values in a dict, ignoring durations."""
+    def __init__(self):
+        self.values = {}
+        self.round_trips = 0
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+    def add(self, key, value, timeout=None):
+        if key in self.values:
+            return False
+        self.values[key] = value
+        return True
+
+    def get_many(self, keys):
+        self.round_trips += 1
+        return dict((key, self.values[key]) for key in keys if key in self.values)
+
+    def set_many(self, values, timeout=None):
+        self.round_trips += 1
+        self.values.update(values)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+
+def load_accounts(*ids):
+    return CollectionStore(Account, [{'userID': id} for id in ids])
+
+
+def slow_double(x):
+    slow_double.calls += 1
+    sleep(0.05)
+    return x * 2
+
+
+class CacheTestCase(TestCase):
+    """The test case for the Barrel cache."""
+
+    def setUp(self):
+        self.engine = DictEngine()
+        slow_double.calls = 0
+
+    def callConcurrently(self, fn, count=5):
+        results = []
+        threads = [Thread(target=lambda: results.append(fn())) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def testCaching(self):
+        """`Cacher` caches function calls"""
+        with caching(self.engine) as cacher:
+            self.assertEqual(cacher(slow_double, 2), 4)
+            self.assertEqual(cacher(slow_double, 2), 4)
+        self.assertEqual(slow_double.calls, 1)
+        self.assertEqual(self.engine.values, {'barrel.tests.slow_double(2)': 4})
+
+    def testCachingLocalLock(self):
+        """`Cacher` with `LocalLock` computes a missing value once"""
+        with caching(self.engine, lock=LocalLock()) as cacher:
+            results = self.callConcurrently(lambda: cacher(slow_double, 2))
+        self.assertEqual(results, [4] * 5)
+        self.assertEqual(slow_double.calls, 1)
+
+    def testCachingLocalLockTimeout(self):
+        """`Cacher` with `LocalLock` stops waiting after the timeout"""
+        with caching(self.engine, lock=LocalLock(timeout=0)) as cacher:
+            results = self.callConcurrently(lambda: cacher(slow_double, 2))
+        self.assertEqual(results, [4] * 5)
+        self.assertTrue(slow_double.calls > 1)
+
+    def testCachingLeaseLock(self):
+        """`Cacher` with `LeaseLock` computes a missing value once"""
+        with caching(self.engine, lock=LeaseLock(interval=0.01)) as cacher:
+            results = self.callConcurrently(lambda: cacher(slow_double, 2))
+        self.assertEqual(results, [4] * 5)
+        self.assertEqual(slow_double.calls, 1)
+        self.assertEqual(self.engine.values, {'barrel.tests.slow_double(2)': 4})
+
+    def testCachingLeaseLockUncached(self):
+        """`Cacher` with `LeaseLock` does not wait for values not to cache"""
+        start = time()
+        with caching(self.engine, needs_cache=lambda x: False,
+                     lock=LeaseLock(timeout=2, interval=0.01)) as cacher:
+            results = self.callConcurrently(lambda: cacher(slow_double, 2), count=4)
+        self.assertEqual(results, [4] * 4)
+        self.assertEqual(slow_double.calls, 4)
+        self.assertTrue(time() - start < 1)
+        self.assertEqual(self.engine.values, {})
+
+    def testCachingLeaseLockError(self):
+        """`Cacher` with `LeaseLock` hands the lease over when its holder fails"""
+        def flaky_double(x):
+            flaky_double.calls += 1
+            sleep(0.05)
+            if flaky_double.calls == 1:
+                raise ValueError(x)
+            return x * 2
+        flaky_double.calls = 0
+
+        def call():
+            try:
+                return cacher(flaky_double, 2)
+            except ValueError:
+                return None
+        start = time()
+        with caching(self.engine, lock=LeaseLock(timeout=2, interval=0.01)) as cacher:
+            results = self.callConcurrently(call, count=4)
+        self.assertEqual(sorted(results), [None, 4, 4, 4])
+        self.assertEqual(flaky_double.calls, 2)
+        self.assertTrue(time() - start < 1)
+
+    def testKeysCallKey(self):
+        """`keys.call_key` generates safe, distinct keys"""
+        self.assertEqual(keys.call_key('mod', 'fn', [1, u'foo bar']), 'mod.fn(1,foo%20bar)')
+        self.assertEqual(keys.call_key('mod', 'fn', [u'\xe9\n']), 'mod.fn(%C3%A9%0A)')
+        self.assertNotEqual(keys.call_key('mod', 'fn', ['a,b']), keys.call_key('mod', 'fn', ['a', 'b']))
+        self.assertNotEqual(keys.call_key('mod', 'fn', [['a', 'b']]), keys.call_key('mod', 'fn', ['a', 'b']))
+        self.assertNotEqual(keys.call_key('mod', 'fn', ['a b']), keys.call_key('mod', 'fn', ['a_b']))
+        self.assertNotEqual(keys.call_key('mod', 'fn', [[]]), keys.call_key('mod', 'fn', [['']]))
+        self.assertNotEqual(keys.call_key('mod', 'fn', []), keys.call_key('mod', 'fn', ['']))
+        self.assertNotEqual(keys.call_key('mod', 'fn', [['', 'a']]),
+                            keys.call_key('mod', 'fn', [[',a']]))
+
+    def testKeysCallKeyLength(self):
+        """`keys.call_key` hashes long keys"""
+        long_key = keys.call_key('mod', 'fn', [range(1000)])
+        self.assertEqual(len(long_key), keys.MAX_LENGTH)
+        # room is left for the lease key of `LeaseLock`
+        self.assertTrue(len('%s:lease' % long_key) <= 250)
+        self.assertTrue(long_key.startswith('mod.fn([0,1,2,'))
+        self.assertNotEqual(long_key, keys.call_key('mod', 'fn', [range(1001)]))
+        self.assertEqual(len(keys.call_key('mod', 'fn', ['a' * 100], max_length=60)), 60)
+
+    def testCachingMany(self):
+        """`Cacher.many` caches many calls with a round trip for each direction"""
+        loaded = []
+
+        def loader(calls):
+            loaded.extend(calls)
+            return [slow_double(*args) for args in calls]
+
+        with caching(self.engine) as cacher:
+            cacher(slow_double, 2)
+            self.assertEqual(cacher.many(slow_double, [1, 2, (3,), 1], loader), [2, 4, 6, 2])
+            self.assertEqual(sorted(loaded), [(1,), (3,)])
+            self.assertEqual(self.engine.round_trips, 2)
+            self.assertEqual(cacher.many(slow_double, [1, 2, 3]), [2, 4, 6])
+            self.assertEqual(self.engine.round_trips, 3)
+        self.assertEqual(slow_double.calls, 3)
+        self.assertEqual(self.engine.values['barrel.tests.slow_double(3)'], 6)
+
+    def testLayeredEngineMany(self):
+        """`LayeredEngine` fetches many values from both tiers"""
+        engine = LayeredEngine(self.engine)
+        engine.remote.set('a', 1)
+        engine.set_many({'b': 2})
+        self.assertEqual(engine.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual(engine.local.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        stats = engine.stats()
+        self.assertEqual(
+            (stats['local_hits'], stats['remote_hits'], stats['misses']), (1, 1, 1))
+
+    def testMemoryEngine(self):
+        """`MemoryEngine` expires values and keeps a bounded number of them"""
+        engine = MemoryEngine(maxsize=2)
+        engine.set('a', 1, 0.01)
+        engine.set('b', 2)
+        self.assertEqual(engine.get('a'), 1)
+        self.assertFalse(engine.add('a', 3))
+        sleep(0.02)
+        self.assertEqual(engine.get('a', 'expired'), 'expired')
+        self.assertTrue(engine.add('a', 3))
+        engine.set('c', 4)
+        self.assertEqual(engine.get('b'), None)
+        self.assertEqual(engine.get('c'), 4)
+
+    def testLayeredEngine(self):
+        """`LayeredEngine` serves values from the local tier first"""
+        engine = LayeredEngine(self.engine, local_duration=0.01)
+        with caching(engine) as cacher:
+            self.assertEqual(cacher(slow_double, 2), 4)
+            self.assertEqual(cacher(slow_double, 2), 4)
+            sleep(0.02)
+            self.assertEqual(cacher(slow_double, 2), 4)
+        self.assertEqual(slow_double.calls, 1)
+        stats = engine.stats()
+        self.assertEqual(
+            (stats['local_hits'], stats['remote_hits'], stats['misses']), (1, 1, 1))
+        self.assertEqual(stats['local_hit_ratio'], 1 / 3.0)
+        self.assertEqual(stats['remote_hit_ratio'], 0.5)
+
+    def testLayeredEngineClearing(self):
+        """`LayeredEngine` deletes the values of both tiers"""
+        engine = LayeredEngine(self.engine)
+        with caching(engine) as cacher:
+            cacher(slow_double, 2)
+        with cache_clearing(engine, keygen=lambda x: ['barrel.tests.slow_double(%s)' % x]) as clear:
+            clear(2)
+        self.assertEqual(self.engine.values, {})
+        self.assertEqual(engine.local.get('barrel.tests.slow_double(2)'), None)
+
+    def testCodecStores(self):
+        """`StoreCodec` encodes stores as their class and data"""
+        codec = StoreCodec()
+        account = Account({'userID': 42})
+        decoded = codec.decode(codec.encode(account))
+        self.assertEqual(type(decoded), Account)
+        self.assertEqual(decoded.id, 42)
+        accounts = load_accounts(1, 2, 3)[1:]
+        decoded = codec.decode(codec.encode(accounts))
+        self.assertEqual(type(decoded), CollectionStore)
+        self.assertEqual(decoded.store_class, Account)
+        self.assertEqual([a.id for a in decoded], [2, 3])
+        decoded = codec.decode(codec.encode([account, 'foo']))
+        self.assertEqual((decoded[0].id, decoded[1]), (42, 'foo'))
+
+    def testCodecValues(self):
+        """`StoreCodec` pickles what it cannot marshal and compresses large values"""
+        codec = StoreCodec(compress_threshold=100)
+        self.assertEqual(codec.decode(codec.encode({'a': [1, 2]})), {'a': [1, 2]})
+        now = datetime.now()
+        self.assertEqual(codec.decode(codec.encode(Account({'date': now}))).data['date'], now)
+        payload = codec.encode(range(1000))
+        self.assertEqual(payload[:2], 'mz')
+        self.assertEqual(codec.decode(payload), range(1000))
+
+    @skipIf(msgpack is None, "msgpack is not installed")
+    def testCodecMsgpack(self):
+        """`StoreCodec` serializes with msgpack"""
+        codec = StoreCodec(serializer='k')
+        decoded = codec.decode(codec.encode(load_accounts(1, 2)))
+        self.assertEqual([a.id for a in decoded], [1, 2])
+
+    def testCachingCodec(self):
+        """`Cacher` with a codec encodes the values it caches"""
+        with caching(self.engine, codec=StoreCodec()) as cacher:
+            self.assertEqual([a.id for a in cacher(load_accounts, 1, 2)], [1, 2])
+            self.assertEqual([a.id for a in cacher(load_accounts, 1, 2)], [1, 2])
+            self.assertEqual([a.id for a in cacher.many(load_accounts, [1, 3])[1]], [3])
+        self.assertTrue(isinstance(self.engine.values['barrel.tests.load_accounts(1,2)'], str))
+
+    def testCachingStale(self):
+        """`Cacher` with a hard duration returns stale values and refreshes them"""
+        futures = []
+        release = Event()
+
+        class RecordingRefresher(Refresher):
+            def __call__(self, key, compute):
+                futures.append(super(RecordingRefresher, self).__call__(key, compute))
+                return futures[-1]
+
+        def gated_double(x):
+            release.wait(1)
+            return slow_double(x)
+
+        key = 'barrel.tests.gated_double(2)'
+        refresher = RecordingRefresher(workers=1)
+        with caching(self.engine, duration=10, hard_duration=100, refresher=refresher) as cacher:
+            release.set()
+            self.assertEqual(cacher(gated_double, 2), 4)
+            release.clear()
+            # makes the value stale
+            self.engine.values[key] = (0, 4)
+            self.assertEqual(cacher.lookup(key), (4, True))
+            self.assertEqual(cacher(gated_double, 2), 4)
+            self.assertEqual(cacher.many(gated_double, [2]), [4])
+            self.assertEqual(refresher.pending, set([key]))
+            self.assertEqual(futures[1], None)
+            release.set()
+            self.assertEqual(futures[0].result(1), 4)
+            self.assertEqual(cacher.lookup(key), (4, False))
+        self.assertEqual(slow_double.calls, 2)
+
+    def testCachingHardExpiry(self):
+        """`Cacher` recomputes values after their hard duration"""
+        engine = MemoryEngine()
+        with caching(engine, duration=0.01, hard_duration=0.02) as cacher:
+            self.assertEqual(cacher(slow_double, 2), 4)
+            sleep(0.03)
+            self.assertEqual(cacher(slow_double, 2), 4)
+        self.assertEqual(slow_double.calls, 2)
+
+    def testThreadPool(self):
+        """`ThreadPool` runs functions in the background, with a bounded queue"""
+        pool = ThreadPool(workers=1, queue_size=1)
+        started, release = Event(), Event()
+        blocked = pool.submit(lambda: started.set() or release.wait(1) or 'done')
+        self.assertTrue(started.wait(1))
+        queued = pool.submit(slow_double, 2)
+        self.assertEqual(pool.submit(slow_double, 3), None)
+        release.set()
+        self.assertEqual(blocked.result(1), True)
+        self.assertEqual(queued.result(1), 4)
+        self.assertRaises(ZeroDivisionError, pool.submit(lambda: 1 / 0).result, 1)
+
+    def testCacheStats(self):
+        """`CacheStats` counts the outcomes and times the calls of each function"""
+        stats = CacheStats().connect()
+        try:
+            with caching(self.engine, needs_cache=lambda x: x != 0) as cacher:
+                cacher(slow_double, 2)
+                cacher(slow_double, 2)
+                cacher(slow_double, 0)
+                cacher.many(slow_double, [2, 3])
+        finally:
+            stats.disconnect()
+        stats = stats.stats()['barrel.tests.slow_double']
+        self.assertEqual((stats['hit'], stats['miss'], stats['no_cache']), (2, 2, 1))
+        self.assertEqual(stats['hit_ratio'], 0.4)
+        self.assertEqual(stats['time']['count'], 4)
+        self.assertEqual(stats['compute_time']['count'], 3)
+        self.assertTrue(stats['compute_time']['p50'] >= 0.05)
+
+    def testCacheStatsStale(self):
+        """`CacheStats` counts the stale values of batches apart from the hits"""
+        def double(x):
+            return x * 2
+
+        stats = CacheStats().connect()
+        try:
+            with caching(self.engine, hard_duration=100) as cacher:
+                cacher.many(double, [2, 3])
+                # makes the values stale
+                for key, (expiry, value) in self.engine.values.items():
+                    self.engine.values[key] = (0, value)
+                self.assertEqual(cacher.many(double, [2, 3, 4]), [4, 6, 8])
+        finally:
+            stats.disconnect()
+        stats = stats.stats()['barrel.tests.double']
+        self.assertEqual((stats['hit'], stats['stale'], stats['miss']), (0, 2, 3))
+        self.assertEqual(stats['hit_ratio'], 0.4)
+
+    def testHistogram(self):
+        """`Histogram` estimates percentiles"""
+        histogram = Histogram(start=1, size=10)
+        for value in range(1, 101):
+            histogram.add(value)
+        self.assertEqual(histogram.mean(), 50.5)
+        self.assertEqual(histogram.percentile(50), 64)
+        self.assertEqual(histogram.percentile(100), 100)
+        self.assertEqual(Histogram().percentile(50), 0)
+
+
+class Client(object):
+    """Client of the `ClientPool` tests."""
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class RpcTestCase(TestCase):
+    """The test case for the Barrel RPC calls."""
+
+    def setUp(self):
+        self.server = StandInServer({
+            'WSUser.getUser': lambda id: {'userID': id},
+            'WSUser.fail': lambda *args: 1 / 0,
+            'WSUser.touch': lambda id: None,
+            'WSUser.search': lambda count: [{'userID': id} for id in range(count)],
+            'WSUser.searchSlow': lambda count: sleep(0.05) or [{'userID': id} for id in range(count)],
+            'WSUser.getSlowUser': lambda id: sleep(0.05) or {'userID': id},
+        }).start()
+        config.configure(REAKTOR=self.server.client_factory())
+
+    def tearDown(self):
+        config.config.clear()
+        reset_client_pool(config)
+        self.server.stop()
+
+    def testRpcCall(self):
+        """`RpcMixin.signature` calls the Reaktor and converts the result"""
+        account = RemoteAccount.get_by_id(42)
+        self.assertTrue(isinstance(account, RemoteAccount))
+        self.assertEqual(account.id, 42)
+        self.assertRaises(StandInError, RemoteAccount.signature, method='fail', args=[])
+
+    def testRpcCallList(self):
+        """RPC list results are lists of stores by default"""
+        accounts = RemoteAccount.signature(method='search', args=[3])
+        self.assertEqual(type(accounts), list)
+        self.assertEqual([a.id for a in accounts], [0, 1, 2])
+        self.assertTrue(accounts[1] in accounts)
+        self.assertEqual(accounts.index(accounts[2]), 2)
+        accounts.sort(key=lambda a: -a.id)
+        self.assertEqual([a.id for a in accounts], [2, 1, 0])
+        accounts.append(RemoteAccount({'userID': 3}))
+        self.assertEqual([a.id for a in accounts], [2, 1, 0, 3])
+        ids = RemoteAccount.signature(method='search', args=[3],
+                                      data_converter=lambda data: data['userID'])
+        self.assertEqual(ids, [0, 1, 2])
+
+    def testRpcCallLazyList(self):
+        """RPC list results are wrapped in a `CollectionStore` for `lazy_lists` classes"""
+        accounts = LazyRemoteAccount.signature(method='search', args=[1000])
+        self.assertTrue(isinstance(accounts, CollectionStore))
+        self.assertEqual(accounts.store_class, LazyRemoteAccount)
+        self.assertEqual(len(accounts), 1000)
+        self.assertEqual(accounts[500].id, 500)
+        self.assertEqual([a.id for a in accounts[10:12]], [10, 11])
+
+    def testCheckData(self):
+        """`check_data` converts items lazily only for `lazy_lists` store converters"""
+        converted = []
+        convert = lambda data: converted.append(data) or data
+        self.assertEqual(check_data(convert, [1, 2]), [1, 2])
+        self.assertEqual(converted, [1, 2])
+        self.assertEqual(check_data(Account, None), None)
+        self.assertEqual(check_data(Account, {'userID': 1}).id, 1)
+        accounts = check_data(Account, [{'userID': 1}])
+        self.assertEqual(type(accounts), list)
+        self.assertEqual(accounts[0].id, 1)
+        accounts = check_data(LazyRemoteAccount, [{'userID': 1}])
+        self.assertEqual(accounts.data, [{'userID': 1}])
+
+    def testRpcCallPool(self):
+        """RPC calls reuse the connections of the client pool"""
+        for id in range(5):
+            self.assertEqual(RemoteAccount.get_by_id(id).id, id)
+        self.assertEqual(self.server.counters, {'connections': 1, 'requests': 5})
+
+    def testRpcCallNoPool(self):
+        """RPC calls open a connection each without pooling"""
+        config.configure(REAKTOR_POOL_SIZE=0)
+        self.assertEqual(get_client_pool(), None)
+        for id in range(5):
+            self.assertEqual(RemoteAccount.get_by_id(id).id, id)
+        self.assertEqual(self.server.counters['connections'], 5)
+
+    def testRpcCalls(self):
+        """`do_rpc_calls` runs calls concurrently and returns their results in order"""
+        start = time()
+        accounts = do_rpc_calls(
+            [RemoteAccount.user_signature(id, 'getSlowUser') for id in range(5)])
+        self.assertTrue(time() - start < 0.2)
+        self.assertEqual([a.id for a in accounts], range(5))
+        self.assertEqual(RemoteAccount.touch_and_get(42).id, 42)
+
+    def testRpcCallAsync(self):
+        """`RpcMixin.signature_async` returns the future of the call"""
+        done = Event()
+        future = RemoteAccount.signature_async(method='getSlowUser', args=[42])
+        future.add_done_callback(lambda f: done.set())
+        self.assertFalse(future.done())
+        self.assertEqual(future.result(1).id, 42)
+        self.assertTrue(done.wait(1))
+        future = do_rpc_call_async(RemoteAccount.user_signature(None, 'fail'))
+        self.assertTrue(isinstance(future.exception(1), StandInError))
+        self.assertRaises(StandInError, future.result)
+
+    def testRpcCallSingleFlight(self):
+        """Concurrent identical RPC calls share one request with `RPC_SINGLE_FLIGHT`"""
+        config.configure(RPC_SINGLE_FLIGHT=True)
+        stats = single_flight_stats()
+        results = []
+        threads = [Thread(target=lambda: results.append(
+            RemoteAccount.signature(method='getSlowUser', args=[42]))) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([a.id for a in results], [42] * 5)
+        self.assertEqual(len(set(map(id, results))), 5)
+        self.assertEqual(self.server.counters['requests'], 1)
+        futures = [RemoteAccount.signature_async(method='getSlowUser', args=[42])
+                   for i in range(5)]
+        self.assertEqual([f.result(1).id for f in futures], [42] * 5)
+        self.assertEqual(self.server.counters['requests'], 2)
+        new_stats = single_flight_stats()
+        self.assertEqual(new_stats['calls'] - stats['calls'], 10)
+        self.assertEqual(new_stats['coalesced'] - stats['coalesced'], 8)
+
+    def testRpcCallSignals(self):
+        """RPC calls send their signature, timings and error"""
+        started, finished = [], []
+        on_started = lambda sig: started.append(sig)
+        on_finished = lambda sig, **record: finished.append(record)
+        rpc_call_started.connect(on_started)
+        rpc_call_finished.connect(on_finished)
+        try:
+            self.assertEqual(RemoteAccount.get_by_id(42).id, 42)
+            self.assertRaises(StandInError, RemoteAccount.signature, method='fail', args=[])
+        finally:
+            rpc_call_started.disconnect(on_started)
+            rpc_call_finished.disconnect(on_finished)
+        self.assertEqual([sig.method for sig in started], ['getUser', 'fail'])
+        self.assertEqual(finished[0]['error'], None)
+        self.assertEqual(finished[0]['result_count'], 1)
+        # the sizes of the request and response bodies are reported by the stand-in client
+        self.assertTrue(finished[0]['request_size'] > len('[42]'))
+        self.assertTrue(finished[0]['response_size'] > len('{"userID": 42}'))
+        self.assertTrue(finished[0]['time'] >= finished[0]['network_time'] > 0)
+        self.assertTrue('conversion_time' in finished[0])
+        self.assertFalse('serialization_time' in finished[0])
+        self.assertTrue(isinstance(finished[1]['error'], StandInError))
+
+    def testRpcCallSignalsSizeEstimate(self):
+        """RPC calls estimate the request size for clients not reporting it"""
+        class Client(object):
+            # like Reaktor clients, any attribute is an interface
+            def __getattr__(self, interface):
+                return self
+
+            def getUser(self, id, data_converter):
+                return data_converter({'userID': id})
+
+        finished = []
+        on_finished = lambda sig, **record: finished.append(record)
+        rpc_call_finished.connect(on_finished)
+        config.configure(REAKTOR=Client)
+        try:
+            self.assertEqual(RemoteAccount.get_by_id(42).id, 42)
+        finally:
+            rpc_call_finished.disconnect(on_finished)
+        self.assertEqual(finished[0]['request_size'], len('[42]'))
+        self.assertFalse('response_size' in finished[0])
+
+    def testRpcStats(self):
+        """`RpcStats` counts the calls and errors and times the calls of each method"""
+        stats = RpcStats().connect()
+        try:
+            do_rpc_calls([RemoteAccount.user_signature(id, 'getSlowUser') for id in range(3)])
+            self.assertRaises(StandInError, RemoteAccount.signature, method='fail', args=[])
+        finally:
+            stats.disconnect()
+        stats = stats.stats()
+        self.assertEqual(stats['WSUser.getSlowUser']['calls'], 3)
+        self.assertTrue(stats['WSUser.getSlowUser']['response_size'] > 0)
+        self.assertEqual(stats['WSUser.getSlowUser']['network_time']['count'], 3)
+        self.assertTrue(stats['WSUser.getSlowUser']['network_time']['p50'] >= 0.05)
+        self.assertEqual((stats['WSUser.fail']['calls'], stats['WSUser.fail']['errors']), (1, 1))
+
+    def testRpcCallSingleFlightCopies(self):
+        """Coalesced RPC calls get their own copies of the data"""
+        config.configure(RPC_SINGLE_FLIGHT=True)
+        results = []
+        threads = [Thread(target=lambda: results.append(
+            RemoteAccount.signature(method='searchSlow', args=[3]))) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.counters['requests'], 1)
+        self.assertFalse(results[0][0].data is results[1][0].data)
+        results[0].reverse()
+        results[0][0].id = 42
+        self.assertEqual([a.id for a in results[1]], [0, 1, 2])
+        futures = [RemoteAccount.signature_async(method='searchSlow', args=[3]) for i in range(2)]
+        results = [future.result(1) for future in futures]
+        self.assertEqual(self.server.counters['requests'], 2)
+        results[0].reverse()
+        results[0][0].id = 42
+        self.assertEqual([a.id for a in results[1]], [0, 1, 2])
+
+    def testRpcCallsErrors(self):
+        """`do_rpc_calls` reports the errors of each call"""
+        sigs = [RemoteAccount.user_signature(1),
+                RemoteAccount.user_signature(None, 'fail'),
+                RemoteAccount.user_signature(2, 'getSlowUser')]
+        try:
+            do_rpc_calls(sigs, timeout=0.02)
+        except RpcBatchError, e:
+            self.assertEqual(e.results[0].id, 1)
+            self.assertEqual(e.results[1:], [None, None])
+            self.assertEqual([e.__class__ for e in e.errors[1:]], [StandInError, RpcTimeout])
+        else:
+            self.fail("RpcBatchError not raised")
+        results = do_rpc_calls(sigs, return_errors=True)
+        self.assertEqual((results[0].id, results[2].id), (1, 2))
+        self.assertTrue(isinstance(results[1], StandInError))
+
+    def testStandInRecordReplay(self):
+        """`Recorder` records the responses replayed by `StandInServer`"""
+        recorder = Recorder(self.server.client_factory())
+        config.configure(REAKTOR=recorder)
+        self.assertEqual(RemoteAccount.get_by_id(42).id, 42)
+        self.assertEqual(len(RemoteAccount.signature(method='search', args=[3])), 3)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            recorder.save(path)
+            replay = StandInServer(responses=load_responses(path)).start()
+        finally:
+            os.remove(path)
+        try:
+            config.configure(REAKTOR=replay.client_factory())
+            self.assertEqual(RemoteAccount.get_by_id(42).id, 42)
+            self.assertEqual([a.id for a in RemoteAccount.signature(method='search', args=[3])],
+                             [0, 1, 2])
+            self.assertRaises(StandInError, RemoteAccount.get_by_id, 43)
+            get_client_pool().clear()
+        finally:
+            replay.stop()
+
+    def testStandInInjection(self):
+        """`StandInServer` delays responses and injects errors"""
+        self.server.latency = 0.02
+        start = time()
+        RemoteAccount.get_by_id(42)
+        self.assertTrue(time() - start >= 0.02)
+        self.server.error_rate = 1
+        self.assertRaises(StandInError, RemoteAccount.get_by_id, 42)
+
+    def testLoadTest(self):
+        """`load_test` reports the throughput and latencies of concurrent calls"""
+        self.server.error_rate = 0.5
+        results = load_test(lambda: RemoteAccount.get_by_id(42), requests=40, concurrency=4)
+        self.assertEqual(results['requests'], 40)
+        self.assertTrue(0 < results['errors'] < 40)
+        self.assertTrue(results['throughput'] > 0)
+        self.assertTrue(0 < results['p50'] <= results['p99'] <= results['max'])
+
+    def testClientPool(self):
+        """`ClientPool` lends clients, replacing the idle and broken ones"""
+        pool = ClientPool(Client, size=1, timeout=0.01, max_idle=0.02)
+        with pool.client() as client:
+            self.assertRaises(PoolTimeout, pool.acquire)
+        with pool.client() as same_client:
+            self.assertTrue(same_client is client)
+        sleep(0.03)
+        with pool.client() as new_client:
+            self.assertFalse(new_client is client)
+        self.assertTrue(client.closed)
+        try:
+            with pool.client() as client:
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertTrue(client.closed)
+        self.assertFalse(pool.acquire() is client)
+
+    def testClientPoolInterrupt(self):
+        """`ClientPool` frees the slot of a client interrupted by a `BaseException`"""
+        class Interrupt(BaseException):
+            pass
+
+        pool = ClientPool(Client, size=1, timeout=0.01)
+        try:
+            with pool.client() as client:
+                raise Interrupt()
+        except Interrupt:
+            pass
+        self.assertTrue(client.closed)
+        with pool.client() as new_client:
+            self.assertFalse(new_client is client)
+
+    def testClientPoolClear(self):
+        """`ClientPool.clear` closes every idle client"""
+        pool = ClientPool(Client, size=4)
+        clients = [pool.acquire() for i in range(4)]
+        for client in clients:
+            pool.release(client)
+        pool.clear()
+        self.assertEqual([client.closed for client in clients], [True] * 4)
+        self.assertEqual(pool.idle.qsize(), 4)
+        self.assertFalse(pool.acquire() in clients)
+
+    def testClientPoolConfig(self):
+        """The client pool is kept until the configuration changes"""
+        pool = get_client_pool()
+        self.assertTrue(get_client_pool() is pool)
+        config.configure(REAKTOR_POOL_SIZE=2)
+        self.assertFalse(get_client_pool() is pool)
+        self.assertEqual(get_client_pool().size, 2)
+
+    def testClientPoolCheck(self):
+        """`ClientPool` replaces the clients failing the health check"""
+        pool = ClientPool(Client, size=1, check=lambda client: False)
+        with pool.client() as client:
+            pass
+        with pool.client() as new_client:
+            self.assertFalse(new_client is client)
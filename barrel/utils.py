@@ -1,3 +1,9 @@
+import Queue
+import bisect
+import sys
+import threading
+
+
 def import_module(import_name):
     """Import function heavily inspired from `werkzeug.utils.import_string`/
     Just dropped the wide string type support and the better import error reporting.
@@ -17,3 +23,266 @@ def import_module(import_name):
         modname = module + '.' + obj
         __import__(modname)
         return sys.modules[modname]
+
+
+class LRUCache(object):
+    """Dict-like cache keeping at most `maxsize` items, the least recently
+    used ones being dropped first. The recency order is kept in a circular
+    doubly linked list of `[prev, next, key, value]` links.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.links = {}
+        self.root = root = []
+        root[:] = [root, root, None, None]
+
+    def get(self, key, default=None):
+        link = self.links.get(key)
+        if link is None:
+            return default
+        link_prev, link_next, _, value = link
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+        root = self.root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+        return value
+
+    def __setitem__(self, key, value):
+        self.pop(key)
+        root = self.root
+        last = root[0]
+        link = [last, root, key, value]
+        last[1] = root[0] = self.links[key] = link
+        if len(self.links) > self.maxsize:
+            self.pop(root[1][2])
+
+    def pop(self, key, default=None):
+        link = self.links.pop(key, None)
+        if link is None:
+            return default
+        link_prev, link_next, _, value = link
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+        return value
+
+    def clear(self):
+        self.links.clear()
+        root = self.root
+        root[:] = [root, root, None, None]
+
+    def __contains__(self, key):
+        return key in self.links
+
+    def __len__(self):
+        return len(self.links)
+
+
+class NullCache(object):
+    """Dict-like cache that never keeps anything."""
+    def get(self, key, default=None):
+        return default
+
+    def __setitem__(self, key, value):
+        pass
+
+    def pop(self, key, default=None):
+        return default
+
+    def clear(self):
+        pass
+
+    def __contains__(self, key):
+        return False
+
+    def __len__(self):
+        return 0
+
+
+class _Call(object):
+    """Call in flight of a `SingleFlight`."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Coalesces the concurrent calls sharing the same key: the first caller
+    runs the function while the others wait for its result, or its error.
+    Waiters giving up after `timeout` seconds run the function themselves.
+    With `copy`, every caller but the ones alone in flight gets its own copy
+    of the result, e.g. `copy.deepcopy` for mutable results.
+    `counters` holds the number of calls and of the coalesced ones.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, fn, timeout=None, copy=None):
+        with self.lock:
+            self.counters['calls'] += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.counters['coalesced'] += 1
+        if leader:
+            try:
+                call.value = fn()
+            except Exception:
+                call.error = sys.exc_info()
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+            # no waiter can join anymore, and the waiters copy the original value
+            if copy is not None and call.waiters:
+                return copy(call.value)
+            return call.value
+        if not call.done.wait(timeout):
+            return fn()
+        if call.error is not None:
+            raise call.error[0], call.error[1], call.error[2]
+        return call.value if copy is None else copy(call.value)
+
+
+class FutureTimeout(Exception):
+    pass
+
+
+class Future(object):
+    """Result of a call running in the background."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.value = None
+        self.error = None
+        self.callbacks = []
+
+    def done(self):
+        return self.finished.is_set()
+
+    def set_result(self, value):
+        self.value = value
+        self.finish()
+
+    def set_exception(self, error):
+        """Sets the error, as returned by `sys.exc_info`."""
+        self.error = error
+        self.finish()
+
+    def finish(self):
+        with self.lock:
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Calls `callback` with the future once it is done."""
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def exception(self, timeout=None):
+        if not self.finished.wait(timeout):
+            raise FutureTimeout()
+        return self.error and self.error[1]
+
+    def result(self, timeout=None):
+        if not self.finished.wait(timeout):
+            raise FutureTimeout()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+
+class ThreadPool(object):
+    """Runs functions on at most `workers` daemon threads, started on demand.
+    At most `queue_size` calls wait for a worker, 0 meaning no bound.
+    """
+    def __init__(self, workers=4, queue_size=0):
+        self.workers = workers
+        self.queue = Queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def submit(self, fn, *args, **kwargs):
+        """Returns the `Future` of the call, or None when the queue is full."""
+        future = Future()
+        try:
+            self.queue.put_nowait((future, fn, args, kwargs))
+        except Queue.Full:
+            return None
+        if len(self.threads) < self.workers:
+            self.start_worker()
+        return future
+
+    def start_worker(self):
+        with self.lock:
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def work(self):
+        while True:
+            future, fn, args, kwargs = self.queue.get()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+
+class Histogram(object):
+    """Counts values in exponentially growing buckets, to estimate their
+    percentiles in constant memory. Values above the last bound are counted
+    in an overflow bucket.
+    """
+    def __init__(self, start=1e-5, factor=2, size=24):
+        self.bounds = [start * factor ** i for i in range(size)]
+        self.counts = [0] * (size + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket holding the given percentile."""
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean(),
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
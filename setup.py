@@ -14,6 +14,11 @@ setup(
     packages=find_packages(),
     platforms='any',
     install_requires=['blinker', 'iso8601', 'holon', ],
+    extras_require={
+        'numpy': ['numpy'],
+        'streaming': ['ijson'],
+        'msgpack': ['msgpack'],
+    },
     dependency_links=[
         'https://github.com/txtr/holon/zipball/0.0.5#egg=holon',
     ]